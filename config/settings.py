@@ -144,10 +144,68 @@ LOGOUT_REDIRECT_URL = '/'
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
+# Caches. 'default' mirrors the catalog and category version counters
+# (the counters themselves are products.VersionCounter rows, bumped
+# atomically in SQL) and holds open payment intents, so every worker must
+# see the same copy: a file cache is shared by all workers on one host
+# (point it at Redis/Memcached across hosts). 'catalog' holds rendered product grids per worker with
+# LRU/TTL eviction; they are keyed by the shared catalog version.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default='/var/tmp/shopclub_cache'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Cache-backed carts (anonymous visitors, or everyone with
+    # CART_STORAGE=products.carts.CacheCartStorage) and the cart badge
+    # counters; a file cache is shared by all workers on one host.
+    # Anonymous carts exist only here, so this backend never culls: entries
+    # are dropped only after TIMEOUT, by purge_stale. Across hosts use
+    # Redis with maxmemory-policy noeviction, never an evicting cache.
+    'carts': {
+        'BACKEND': 'products.cache_backends.CartFileCache',
+        'LOCATION': config('CART_CACHE_LOCATION', default='/var/tmp/shopclub_carts'),
+        'TIMEOUT': 60 * 60 * 24 * 14,
+    },
+}
+
+# Longest a worker keeps its in-memory category list without reloading
+CATEGORY_REGISTRY_TTL = config('CATEGORY_REGISTRY_TTL', default=60, cast=int)
+
+# Cart backend for signed-in users; anonymous carts always use the cache
+CART_STORAGE = config('CART_STORAGE', default='products.carts.DatabaseCartStorage')
+
+# Seconds stock stays held for a shopper between payment intent and order
+STOCK_HOLD_TTL = config('STOCK_HOLD_TTL', default=15 * 60, cast=int)
+
+# Orders older than this many days are moved to the archive by archive_orders
+ORDER_ARCHIVE_DAYS = config('ORDER_ARCHIVE_DAYS', default=365, cast=int)
+
+# Product search backend (dotted path). Empty picks Postgres full-text
+# search on PostgreSQL and the in-process index everywhere else.
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='')
+
+# Catalog listing pagination: 'keyset' (cursor tokens) or 'offset' (page numbers)
+CATALOG_PAGINATION = config('CATALOG_PAGINATION', default='keyset')
+
 # Stripe
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+# Point at a local fake (orders.fake_stripe) for tests and load runs
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')
+# Seconds; a slow Stripe must not pin a worker for the library's 80s default
+STRIPE_CONNECT_TIMEOUT = config('STRIPE_CONNECT_TIMEOUT', default=3.0, cast=float)
+STRIPE_READ_TIMEOUT = config('STRIPE_READ_TIMEOUT', default=10.0, cast=float)
+STRIPE_MAX_RETRIES = config('STRIPE_MAX_RETRIES', default=2, cast=int)
+STRIPE_POOL_SIZE = config('STRIPE_POOL_SIZE', default=10, cast=int)
 
 # Session
 SESSION_COOKIE_AGE = 86400
@@ -2,16 +2,23 @@
 Admin configuration for orders app
 """
 from django.contrib import admin
-from .models import Order, OrderItem, ShippingAddress
+from django.utils.html import format_html_join
+from .models import ArchivedOrder, Order, OrderItem, ShippingAddress, StripeEvent
 
 
 class OrderItemInline(admin.TabularInline):
     """Inline admin for order items"""
     model = OrderItem
     extra = 0
-    readonly_fields = ['product', 'quantity', 'price', 'total_price']
+    # Snapshot columns only, so the inline never joins the catalog
+    fields = ['product_name', 'category_name', 'quantity', 'price', 'total_price']
+    readonly_fields = fields
     can_delete = False
 
+    def has_add_permission(self, request, obj=None):
+        """Order lines are written by checkout only"""
+        return False
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -57,13 +64,43 @@ class OrderAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only view of orders moved out by archive_orders"""
+    list_display = ['order_number', 'user', 'full_name', 'total_amount',
+                    'payment_status', 'created_at', 'archived_at']
+    list_filter = ['payment_status', 'created_at']
+    search_fields = ['order_number', 'user__username', 'email', 'full_name']
+    list_select_related = ['user']
+    ordering = ['-created_at']
+    date_hierarchy = 'created_at'
+    exclude = ['line_snapshot']
+    readonly_fields = ['lines']
+    
+    @admin.display(description='Items')
+    def lines(self, obj):
+        return format_html_join(
+            '', '<div>{} ({}) x {} @ {} = {}</div>',
+            ((line['name'], line['category'], line['quantity'], line['price'], line['total'])
+             for line in obj.line_snapshot),
+        )
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     """Admin for OrderItem model"""
-    list_display = ['order', 'product', 'quantity', 'price', 'total_price']
+    list_display = ['order', 'product_name', 'quantity', 'price', 'total_price']
     list_filter = ['order__created_at']
-    search_fields = ['order__order_number', 'product__name']
-    readonly_fields = ['total_price']
+    list_select_related = ['order']
+    search_fields = ['order__order_number', 'product_name']
+    readonly_fields = ['product_name', 'product_slug', 'image_url', 'category_name', 'total_price']
+    raw_id_fields = ['order', 'product']
     
     def has_add_permission(self, request):
         """Disable manual order item creation"""
@@ -77,4 +114,19 @@ class ShippingAddressAdmin(admin.ModelAdmin):
     list_filter = ['is_default', 'country', 'created_at']
     search_fields = ['user__username', 'full_name', 'city', 'postal_code']
     readonly_fields = ['created_at']
-    ordering = ['user', '-is_default', '-created_at']
\ No newline at end of file
+    ordering = ['user', '-is_default', '-created_at']
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """Read-only view of the Stripe webhook inbox"""
+    list_display = ['id', 'type', 'payment_intent', 'created', 'processed_at']
+    list_filter = ['type', 'processed_at']
+    search_fields = ['id', 'payment_intent']
+    ordering = ['-created']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Archival of old orders and reads across hot and archived orders
+
+Orders created before a cutoff are copied to ArchivedOrder and deleted
+from Order (their item rows with them) in short keyset-paginated
+transactions, so the hot tables and their indexes stay the size of
+recent trade. The cutoff only moves forward, so every archived order is
+older than every hot one and history reads can page through hot orders
+first and archived ones after.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from products.purge import purge_in_batches
+
+from .models import ArchivedOrder, Order
+
+
+# Columns copied across; both models share them under the same names
+ARCHIVED_FIELDS = [
+    field.attname for field in ArchivedOrder._meta.concrete_fields
+    if field.name != 'archived_at'
+]
+
+
+def archivable_orders(days=None):
+    """Orders created more than days (ORDER_ARCHIVE_DAYS by default) ago"""
+    days = settings.ORDER_ARCHIVE_DAYS if days is None else days
+    return Order.objects.filter(created_at__lt=timezone.now() - timedelta(days=days))
+
+
+def archive_orders(days=None, **kwargs):
+    """
+    Move archivable orders to ArchivedOrder in batches (see
+    purge_in_batches for batch_size, pause and on_batch). Each batch is
+    copied and deleted in the same transaction. Returns the PurgeResult,
+    whose deleted count includes the dropped item rows; archived holds
+    the number of orders moved.
+    """
+    queryset = archivable_orders(days)
+    archived = 0
+
+    def copy(pks):
+        nonlocal archived
+        rows = queryset.filter(pk__in=pks).values(*ARCHIVED_FIELDS)
+        archived += len(ArchivedOrder.objects.bulk_create([ArchivedOrder(**row) for row in rows]))
+
+    result = purge_in_batches(queryset, before_delete=copy, **kwargs)
+    result.archived = archived
+    return result
+
+
+class OrderHistory:
+    """
+    A user's hot orders followed by their archived ones, newest first, as
+    a sequence Paginator can page through. The total is one COUNT over
+    both tables; a page that falls within the hot orders never touches
+    the archive.
+    """
+
+    def __init__(self, user, defer=()):
+        self.hot = Order.objects.filter(user=user).defer(*defer)
+        self.archived = ArchivedOrder.objects.filter(user=user).defer(*defer)
+        self._hot_count = None
+
+    def count(self):
+        return (
+            self.hot.order_by().values('pk')
+            .union(self.archived.order_by().values('pk'), all=True)
+            .count()
+        )
+
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        orders = list(self.hot[start:stop])
+        if stop is not None and len(orders) == stop - start:
+            return orders
+        # The page runs past the hot orders; carry on into the archive
+        if orders:
+            self._hot_count = start + len(orders)
+        offset = max(start - self.hot_count(), 0)
+        end = None if stop is None else offset + (stop - start) - len(orders)
+        return orders + list(self.archived[offset:end])
+
+
+def get_user_order(user, order_number):
+    """user's order by number, hot or archived; None if there is none"""
+    order = Order.objects.filter(user=user, order_number=order_number).first()
+    if order is None:
+        order = ArchivedOrder.objects.filter(user=user, order_number=order_number).first()
+    return order
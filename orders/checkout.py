@@ -0,0 +1,100 @@
+"""
+Transactional order placement
+"""
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+
+from products.cache import bump_catalog_version
+from products.cards import refresh_card_stock
+from products.models import Product, StockHold
+from products.reservations import available_to_sell
+
+from .models import OrderItem
+
+
+class CheckoutError(Exception):
+    """The cart cannot be turned into an order as it stands"""
+
+
+class InsufficientStock(CheckoutError):
+    """A cart line asks for more than is left in stock"""
+
+    def __init__(self, product, requested, available=None):
+        self.product = product
+        self.requested = requested
+        self.available = product.stock if available is None else available
+        super().__init__(f'{product.name} has only {self.available} items in stock.')
+
+
+def decrement_stock(quantities):
+    """
+    Take {product id: quantity} out of stock in one UPDATE. Each row only
+    matches while it still holds enough stock, so the statement can never
+    drive stock below zero; returns the number of products updated.
+    """
+    enough = Q()
+    for product_id, quantity in quantities.items():
+        enough |= Q(pk=product_id, stock__gte=quantity)
+    return Product.objects.filter(enough).update(stock=Case(
+        *[When(pk=product_id, then=F('stock') - quantity)
+          for product_id, quantity in quantities.items()],
+        default=F('stock'),
+        output_field=PositiveIntegerField(),
+    ))
+
+
+def place_order(order, cart):
+    """
+    Save an unsaved order for the contents of cart and empty the cart, all
+    in one transaction.
+
+    The cart's products are locked with SELECT ... FOR UPDATE in id order,
+    so concurrent checkouts queue on shared products instead of
+    deadlocking. Prices and stock are read from the locked rows, less
+    other shoppers' active holds; the shopper's own holds are converted
+    (deleted) as their stock is taken. Stock is taken in one conditional
+    UPDATE and the lines written with one bulk_create, so the statement
+    count does not grow with the cart.
+    Raises CheckoutError (or InsufficientStock) and rolls back if the
+    cart is empty or a line can no longer be filled.
+    """
+    quantities = cart.quantities()
+    if not quantities:
+        raise CheckoutError('Your cart is empty.')
+
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update(of=('self',))
+            .select_related('category')
+            .filter(pk__in=list(quantities))
+            .order_by('pk')
+        )
+        if len(products) != len(quantities):
+            raise CheckoutError('A product in your cart is no longer available.')
+        available = available_to_sell(products, exclude_user=order.user)
+        for product in products:
+            if quantities[product.pk] > available[product.pk]:
+                raise InsufficientStock(product, quantities[product.pk], available[product.pk])
+
+        items = []
+        for product in products:
+            item = OrderItem(product=product, quantity=quantities[product.pk], price=product.price)
+            item.copy_product(product)
+            items.append(item)
+        order.total_amount = sum(item.total_price for item in items)
+        order.item_count = sum(quantities.values())
+        order.line_snapshot = [item.snapshot() for item in items]
+        order.save()
+
+        if decrement_stock(quantities) != len(products):
+            # Unreachable while the locks hold; never oversell regardless
+            raise CheckoutError('Stock changed during checkout. Please try again.')
+        StockHold.objects.filter(user=order.user, product_id__in=list(quantities)).delete()
+        refresh_card_stock(quantities)
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        cart.clear()
+        # Stock updates skip model signals; refresh cached listings by hand
+        transaction.on_commit(bump_catalog_version)
+    return order
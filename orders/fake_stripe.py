@@ -0,0 +1,183 @@
+"""
+In-process fake of the Stripe API for tests and benchmarks
+
+Serves the small part of the PaymentIntent API that checkout uses, honours
+Idempotency-Key headers like Stripe does (a replay returns the response as
+first sent, marked Idempotent-Replayed), and records every request so
+callers can count round trips. latency delays every response and
+fail_next answers the next requests with 500s, to exercise timeouts and
+retries. Point the client at it with stripe.api_base = fake.url (or
+STRIPE_API_BASE). webhook() builds signed event deliveries the way Stripe
+sends them, for replaying against stripe_webhook.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+
+def decode_form(body):
+    """Decode Stripe's form encoding, one nesting level deep (metadata[key]=value)"""
+    params = {}
+    for name, value in parse_qsl(body, keep_blank_values=True):
+        if '[' in name and name.endswith(']'):
+            outer, inner = name[:-1].split('[', 1)
+            params.setdefault(outer, {})[inner] = value
+        else:
+            params[name] = value
+    return params
+
+
+class FakeStripe:
+    """Threaded HTTP server on 127.0.0.1 holding payment intents in memory"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.fail_next = 0
+        self.intents = {}
+        self.requests = []  # (method, path, idempotency key)
+        self._replies = {}  # idempotency key -> (status, body as first sent)
+        self._ids = itertools.count(1)
+        self._event_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, method, path):
+        return sum(1 for m, p, _ in self.requests if (m, p) == (method, path))
+
+    def succeed(self, intent_id):
+        """Mark an intent as paid, as if the customer had confirmed it"""
+        self.intents[intent_id]['status'] = 'succeeded'
+
+    def webhook(self, event_type, intent_id, secret):
+        """
+        A signed delivery of a new event about intent_id: returns (payload
+        bytes, Stripe-Signature header). Post the same pair again to
+        simulate a redelivery.
+        """
+        intent = self.intents.get(intent_id) or {'id': intent_id, 'object': 'payment_intent'}
+        event = {
+            'id': f'evt_fake{next(self._event_ids):08d}',
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()),
+            'data': {'object': intent},
+        }
+        payload = json.dumps(event).encode()
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256
+        ).hexdigest()
+        return payload, f't={timestamp},v1={signature}'
+
+    def handle(self, method, path, params, idempotency_key):
+        """Answer one request: (status, body, whether it is a replay)"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests.append((method, path, idempotency_key))
+            if self.fail_next:
+                self.fail_next -= 1
+                return 500, error('api_error', 'Injected failure.'), False
+            if idempotency_key and idempotency_key in self._replies:
+                status, body = self._replies[idempotency_key]
+                return status, json.loads(body), True
+            status, payload = self.route(method, path, params)
+            if idempotency_key:
+                # A snapshot: later updates to the intent must not leak into replays
+                self._replies[idempotency_key] = (status, json.dumps(payload))
+            return status, payload, False
+
+    def route(self, method, path, params):
+        parts = path.strip('/').split('/')
+        if parts[:2] != ['v1', 'payment_intents']:
+            return 404, error('invalid_request_error', f'Unrecognized request URL ({path}).')
+        if len(parts) == 2 and method == 'POST':
+            return 200, self.create_intent(params)
+        intent = self.intents.get(parts[2]) if len(parts) == 3 else None
+        if intent is None:
+            return 404, error('invalid_request_error', 'No such payment_intent.')
+        if method == 'GET':
+            return 200, intent
+        if intent['status'] in ('succeeded', 'canceled'):
+            return 400, error(
+                'invalid_request_error',
+                f"This PaymentIntent's amount could not be updated because it has a status of {intent['status']}.",
+            )
+        if 'amount' in params:
+            intent['amount'] = int(params['amount'])
+        intent['metadata'].update(params.get('metadata', {}))
+        return 200, intent
+
+    def create_intent(self, params):
+        intent_id = f'pi_fake{next(self._ids):06d}'
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(params['amount']),
+            'currency': params.get('currency', 'usd'),
+            'client_secret': f'{intent_id}_secret_fake',
+            'metadata': params.get('metadata', {}),
+            'status': 'requires_payment_method',
+        }
+        self.intents[intent_id] = intent
+        return intent
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else ''
+                status, payload, replayed = fake.handle(
+                    self.command, self.path.split('?', 1)[0],
+                    decode_form(body), self.headers.get('Idempotency-Key'),
+                )
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    if replayed:
+                        self.send_header('Idempotent-Replayed', 'true')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client timed out and hung up
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def error(error_type, message):
+    return {'error': {'type': error_type, 'message': message}}
@@ -0,0 +1,43 @@
+"""
+Move old orders out of the hot order tables in small batches
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.archive import archive_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Move orders older than --days into the order archive, in short '
+        'keyset-paginated transactions with a pause between batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_DAYS,
+                            help='Archive orders created more than this many days ago '
+                                 f'(default: {settings.ORDER_ARCHIVE_DAYS})')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Orders moved per transaction (default: 500)')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to sleep between batches (default: 0.1)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1.')
+
+        def on_batch(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{result.deleted} rows ({result.rows_per_second:,.0f} rows/sec)')
+
+        result = archive_orders(
+            options['days'], batch_size=options['batch_size'],
+            pause=options['pause'], on_batch=on_batch,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {result.archived} orders ({result.deleted} rows removed) '
+            f'in {result.batches} batches, '
+            f'{result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/sec).'
+        ))
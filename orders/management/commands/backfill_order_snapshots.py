@@ -0,0 +1,35 @@
+"""
+Fill product snapshots on order lines placed before they were recorded
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.snapshots import backfill_item_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy product name, slug, image URL and category name onto existing '
+        'order lines, in keyset-paginated batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Order lines updated per transaction (default: 1000)')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches (default: 0)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        def on_batch(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{result.updated} lines ({result.rows_per_second:,.0f} rows/sec)')
+
+        result = backfill_item_snapshots(
+            options['batch_size'], pause=options['pause'], on_batch=on_batch
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Filled {result.updated} order lines in {result.batches} batches, '
+            f'{result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/sec).'
+        ))
@@ -0,0 +1,131 @@
+"""
+Concurrency benchmark for order placement
+"""
+import queue
+import random
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from orders.checkout import CheckoutError, place_order
+from orders.models import Order, OrderItem
+from products.carts import get_cart_storage_class
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Place orders from many concurrent shoppers against a few scarce '
+        'scratch products, then report orders/sec and check that no stock was '
+        'oversold. Scratch users, products and orders are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shoppers', type=int, default=200,
+                            help='Shoppers, each placing one order (default: 200)')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Concurrent checkout workers (default: 8)')
+        parser.add_argument('--products', type=int, default=5,
+                            help='Scratch products shared by every cart (default: 5)')
+        parser.add_argument('--stock', type=int, default=150,
+                            help='Starting stock of each scratch product (default: 150)')
+
+    def handle(self, *args, **options):
+        for name in ('shoppers', 'threads', 'products', 'stock'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1.')
+        if connection.vendor == 'sqlite' and options['threads'] > 1:
+            self.stderr.write('SQLite serialises writers; numbers will not reflect Postgres.')
+
+        tag = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Benchmark {tag}', slug=f'benchmark-{tag}')
+        users = []
+        try:
+            products = [
+                Product.objects.create(
+                    name=f'Benchmark {tag} {i}', slug=f'benchmark-{tag}-{i}',
+                    category=category, description='Checkout benchmark product',
+                    price=10, stock=options['stock'],
+                )
+                for i in range(options['products'])
+            ]
+            shoppers = queue.Queue()
+            for i in range(options['shoppers']):
+                user = User.objects.create_user(f'benchmark-{tag}-{i}')
+                users.append(user)
+                cart = get_cart_storage_class(user)(None, user=user)
+                for product in random.sample(products, random.randint(1, len(products))):
+                    cart.add(product, random.randint(1, 3))
+                shoppers.put(user)
+
+            placed, rejected, errors = self.run(shoppers, options['threads'])
+            self.report(products, options['stock'], placed, rejected, errors)
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            category.delete()
+
+    def run(self, shoppers, threads):
+        counts = {'placed': 0, 'rejected': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        user = shoppers.get_nowait()
+                    except queue.Empty:
+                        return
+                    order = Order(
+                        user=user, full_name='Benchmark', email='benchmark@example.com',
+                        phone='0', address_line_1='-', city='-', state='-', postal_code='-',
+                    )
+                    cart = get_cart_storage_class(user)(None, user=user)
+                    try:
+                        place_order(order, cart)
+                        outcome = 'placed'
+                    except CheckoutError:
+                        outcome = 'rejected'
+                    with lock:
+                        counts[outcome] += 1
+            except Exception as exc:  # reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        started = time.monotonic()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.seconds = time.monotonic() - started
+        return counts['placed'], counts['rejected'], errors
+
+    def report(self, products, starting_stock, placed, rejected, errors):
+        sold = dict(
+            OrderItem.objects.filter(product__in=products)
+            .values_list('product_id')
+            .annotate(sold=Sum('quantity'))
+        )
+        oversold = 0
+        for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+            if product.stock + sold.get(product.pk, 0) != starting_stock:
+                oversold += 1
+        rate = placed / self.seconds if self.seconds else 0.0
+        self.stdout.write(
+            f'{placed} orders placed, {rejected} rejected for stock in {self.seconds:.2f}s '
+            f'({rate:,.0f} orders/sec).'
+        )
+        for exc in errors:
+            self.stderr.write(f'Worker failed: {exc!r}')
+        if oversold or errors:
+            raise CommandError(f'{oversold} products with inconsistent stock.')
+        self.stdout.write(self.style.SUCCESS('No stock oversold.'))
@@ -0,0 +1,45 @@
+"""
+Drain the Stripe webhook inbox in batches
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.webhooks import drain_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply queued Stripe webhook events to orders, --batch-size at a time, '
+        'with one UPDATE per payment status transition per batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Events applied per transaction (default: 500)')
+        parser.add_argument('--forever', action='store_true',
+                            help='Keep polling for new events instead of exiting when drained')
+        parser.add_argument('--idle-sleep', type=float, default=1.0,
+                            help='Seconds to wait when the inbox is empty, with --forever (default: 1)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+
+        def on_batch(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{result.processed} events ({result.events_per_second:,.0f} events/sec)'
+                )
+
+        while True:
+            result = drain_events(options['batch_size'], on_batch=on_batch)
+            if result.processed or not options['forever']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Processed {result.processed} events in {result.batches} batches, '
+                    f'{result.seconds:.2f}s ({result.events_per_second:,.0f} events/sec).'
+                ))
+            if not options['forever']:
+                break
+            if not result.processed:
+                time.sleep(options['idle_sleep'])
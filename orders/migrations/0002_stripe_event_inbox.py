@@ -0,0 +1,34 @@
+# Generated by Django 4.2.11 on 2026-10-17 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_payment_intent',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('type', models.CharField(max_length=100)),
+                ('payment_intent', models.CharField(blank=True, max_length=200)),
+                ('created', models.DateTimeField()),
+                ('payload', models.JSONField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created', 'received_at'],
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['created', 'received_at'], name='orders_stripeevent_pending')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.11 on 2026-10-17 18:52
+
+from django.db import migrations, models
+
+
+# Must match orders.numbers.BLOCK_SIZE: each nextval() reserves one block
+BLOCK_SIZE = 100
+
+
+def create_counter(apps, schema_editor):
+    """Seed the counter row, and the block sequence on Postgres"""
+    apps.get_model('orders', 'OrderNumberCounter').objects.create(pk=1, value=0)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"CREATE SEQUENCE orders_order_number_seq START WITH 1 INCREMENT BY {BLOCK_SIZE}"
+    )
+
+
+def drop_counter(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP SEQUENCE IF EXISTS orders_order_number_seq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_stripe_event_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_counter, drop_counter),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.11 on 2026-10-17 19:21
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def backfill_snapshots(apps, schema_editor):
+    """Fill item counts and line snapshots of existing orders in batches"""
+    Order = apps.get_model('orders', 'Order')
+    orders = Order.objects.order_by('pk').prefetch_related('items__product__category')
+    batch = []
+    for order in orders.iterator(chunk_size=BATCH_SIZE):
+        lines = []
+        for item in order.items.all():
+            product = item.product
+            lines.append({
+                'product_id': product.pk,
+                'name': product.name,
+                'slug': product.slug,
+                'image_url': product.image.url if product.image else '',
+                'category': product.category.name,
+                'quantity': item.quantity,
+                'price': str(item.price),
+                'total': str(item.price * item.quantity),
+            })
+        order.item_count = sum(line['quantity'] for line in lines)
+        order.line_snapshot = lines
+        batch.append(order)
+        if len(batch) >= BATCH_SIZE:
+            Order.objects.bulk_update(batch, ['item_count', 'line_snapshot'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['item_count', 'line_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_number_allocator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='line_snapshot',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.11 on 2026-10-17 19:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 500
+
+
+def backfill_item_snapshots(apps, schema_editor):
+    """
+    Copy product details onto existing order lines in keyset batches while
+    the product foreign key still cascades, so no line can lose its
+    product before it has a snapshot.
+    """
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    last_pk = 0
+    while True:
+        items = list(
+            OrderItem.objects.filter(pk__gt=last_pk)
+            .select_related('product__category')
+            .order_by('pk')[:BATCH_SIZE]
+        )
+        if not items:
+            break
+        last_pk = items[-1].pk
+        for item in items:
+            product = item.product
+            item.product_name = product.name
+            item.product_slug = product.slug
+            item.image_url = product.image.url if product.image else ''
+            item.category_name = product.category.name
+        OrderItem.objects.bulk_update(
+            items, ['product_name', 'product_slug', 'image_url', 'category_name']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_stockhold'),
+        ('orders', '0004_order_line_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='image_url',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_slug',
+            field=models.SlugField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(backfill_item_snapshots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.product'),
+        ),
+    ]
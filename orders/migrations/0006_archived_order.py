@@ -0,0 +1,48 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0005_orderitem_product_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_number', models.CharField(editable=False, max_length=100, unique=True)),
+                ('full_name', models.CharField(max_length=200)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(max_length=20)),
+                ('address_line_1', models.CharField(max_length=250)),
+                ('address_line_2', models.CharField(blank=True, max_length=250)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('postal_code', models.CharField(max_length=20)),
+                ('country', models.CharField(default='UK', max_length=100)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('line_snapshot', models.JSONField(default=list, editable=False)),
+                ('payment_status', models.CharField(choices=[('pending', 'Pending'), ('paid', 'Paid'), ('failed', 'Failed'), ('refunded', 'Refunded')], default='pending', max_length=20)),
+                ('stripe_payment_intent', models.CharField(blank=True, db_index=True, max_length=200)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer_notes', models.TextField(blank=True)),
+                ('admin_notes', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='orders_arch_user_id_6febd8_idx'), models.Index(fields=['-created_at'], name='orders_arch_created_892a6d_idx')],
+            },
+        ),
+    ]
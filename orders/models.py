@@ -32,10 +32,13 @@ class Order(models.Model):
     
     # Order Details
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Written once at checkout so order pages never need the item rows
+    item_count = models.PositiveIntegerField(default=0)
+    line_snapshot = models.JSONField(default=list, editable=False)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
     
     # Stripe Information
-    stripe_payment_intent = models.CharField(max_length=200, blank=True)
+    stripe_payment_intent = models.CharField(max_length=200, blank=True, db_index=True)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -59,33 +62,152 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         """Generate order number if not exists"""
         if not self.order_number:
-            import uuid
-            self.order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+            from .numbers import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
     
     @property
     def order_items_count(self):
         """Total number of items in order"""
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
 
 
 class OrderItem(models.Model):
     """Individual items in an order"""
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # Deleting a product keeps the order history; the snapshot below remains
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    # What was bought, as it was at purchase time
+    product_name = models.CharField(max_length=200, blank=True)
+    product_slug = models.SlugField(max_length=200, blank=True)
+    image_url = models.CharField(max_length=500, blank=True)
+    category_name = models.CharField(max_length=200, blank=True)
+    
     class Meta:
         ordering = ['id']
     
     def __str__(self):
-        return f"{self.product.name} x {self.quantity}"
+        return f"{self.product_name} x {self.quantity}"
     
     @property
     def total_price(self):
         """Calculate total price for this item"""
         return self.price * self.quantity
+    
+    def copy_product(self, product):
+        """Fill the snapshot fields from a product loaded with its category"""
+        self.product_name = product.name
+        self.product_slug = product.slug
+        self.image_url = product.image.url if product.image else ''
+        self.category_name = product.category.name
+    
+    def snapshot(self):
+        """This line as stored in Order.line_snapshot"""
+        return {
+            'product_id': self.product_id,
+            'name': self.product_name,
+            'slug': self.product_slug,
+            'image_url': self.image_url,
+            'category': self.category_name,
+            'quantity': self.quantity,
+            'price': str(self.price),
+            'total': str(self.total_price),
+        }
+
+
+class ArchivedOrder(models.Model):
+    """
+    An order moved out of the hot Order table by `manage.py archive_orders`
+    (see orders.archive). It keeps the original id and order number; its
+    lines live in line_snapshot, the item rows are dropped.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    order_number = models.CharField(max_length=100, unique=True, editable=False)
+    
+    full_name = models.CharField(max_length=200)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    address_line_1 = models.CharField(max_length=250)
+    address_line_2 = models.CharField(max_length=250, blank=True)
+    city = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    postal_code = models.CharField(max_length=20)
+    country = models.CharField(max_length=100, default='UK')
+    
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    item_count = models.PositiveIntegerField(default=0)
+    line_snapshot = models.JSONField(default=list, editable=False)
+    payment_status = models.CharField(
+        max_length=20, choices=Order.PAYMENT_STATUS_CHOICES, default='pending'
+    )
+    stripe_payment_intent = models.CharField(max_length=200, blank=True, db_index=True)
+    
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    paid_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    customer_notes = models.TextField(blank=True)
+    admin_notes = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # A shopper's order history, newest first
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Order {self.order_number} (archived)"
+    
+    @property
+    def order_items_count(self):
+        return self.item_count
+
+
+class OrderNumberCounter(models.Model):
+    """
+    Single-row order number counter for databases without sequences; on
+    Postgres numbers come from a sequence instead (see orders.numbers).
+    """
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return str(self.value)
+
+
+class StripeEvent(models.Model):
+    """
+    Inbox of verified Stripe webhook events, keyed by Stripe's event id so
+    redeliveries are dropped on insert. Drained in batches by
+    `manage.py process_stripe_events` (see orders.webhooks).
+    """
+    id = models.CharField(max_length=255, primary_key=True)
+    type = models.CharField(max_length=100)
+    payment_intent = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField()  # When Stripe raised the event
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created', 'received_at']
+        indexes = [
+            # The unprocessed backlog, oldest first
+            models.Index(
+                fields=['created', 'received_at'],
+                condition=models.Q(processed_at__isnull=True),
+                name='orders_stripeevent_pending',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.type} {self.id}"
 
 
 class ShippingAddress(models.Model):
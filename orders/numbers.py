@@ -0,0 +1,88 @@
+"""
+Order number allocation
+
+Numbers are ORD- followed by the allocated sequence value as eight
+fixed-width Crockford base32 digits and three random ones. The sequence
+prefix makes numbers unique and roughly time-ordered, so inserts land at
+the right-hand edge of the order_number index instead of at random
+pages; the random tail keeps neighbouring numbers from being guessed.
+"""
+import os
+import secrets
+import threading
+
+from django.db import connection
+from django.db.models import F
+
+from .models import OrderNumberCounter
+
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32
+SEQUENCE_WIDTH = 8  # 32**8, about 1.1 trillion orders
+RANDOM_WIDTH = 3
+SEQUENCE = 'orders_order_number_seq'
+# Must match the sequence's INCREMENT BY (orders migration 0003)
+BLOCK_SIZE = 100
+
+
+def encode(value, width=SEQUENCE_WIDTH):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        digits.append(ALPHABET[digit])
+    if value:
+        raise OverflowError('Order number sequence exhausted.')
+    return ''.join(reversed(digits))
+
+
+def format_order_number(value):
+    tail = ''.join(secrets.choice(ALPHABET) for _ in range(RANDOM_WIDTH))
+    return f'ORD-{encode(value)}{tail}'
+
+
+class OrderNumberAllocator:
+    """
+    Hands out sequence values from a per-process block.
+
+    On Postgres one nextval() reserves BLOCK_SIZE values; sequences are
+    not transactional, so a rolled-back order only leaves a gap. Other
+    backends bump a counter row one value at a time inside the caller's
+    transaction, so a rollback returns the value along with the order.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def allocate(self):
+        with self._lock:
+            # A forked worker must not keep using its parent's block
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._next, self._end = self.reserve()
+                self._pid = os.getpid()
+            value = self._next
+            self._next += 1
+            return value
+
+    def reserve(self):
+        """Reserve a fresh block; returns (first value, end value)"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT nextval(%s)', [SEQUENCE])
+                start = cursor.fetchone()[0]
+            return start, start + BLOCK_SIZE
+        counter = OrderNumberCounter.objects.filter(pk=1)
+        if not counter.update(value=F('value') + 1):
+            # Seeded by the migration; recreated if a flush removed it
+            OrderNumberCounter.objects.get_or_create(pk=1)
+            counter.update(value=F('value') + 1)
+        value = counter.values_list('value', flat=True).get()
+        return value, value + 1
+
+
+order_number_allocator = OrderNumberAllocator()
+
+
+def next_order_number():
+    return format_order_number(order_number_allocator.allocate())
@@ -0,0 +1,155 @@
+"""
+Stripe PaymentIntents for checkout
+"""
+import hashlib
+import json
+
+import requests
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from products.cache import bump_version, get_version
+
+
+def build_http_client(connect_timeout=None, read_timeout=None, pool_size=None):
+    """
+    Stripe HTTP client on one requests session shared by every thread, so
+    keep-alive connections are pooled across requests instead of each
+    worker thread dialling Stripe afresh. Timeouts bound how long a slow
+    Stripe can hold a worker.
+    """
+    pool_size = settings.STRIPE_POOL_SIZE if pool_size is None else pool_size
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return stripe.http_client.RequestsClient(
+        timeout=(
+            settings.STRIPE_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout,
+            settings.STRIPE_READ_TIMEOUT if read_timeout is None else read_timeout,
+        ),
+        session=session,
+    )
+
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+stripe.api_base = settings.STRIPE_API_BASE
+# Timeouts and connection errors are retried with the same idempotency key
+stripe.max_network_retries = settings.STRIPE_MAX_RETRIES
+stripe.default_http_client = build_http_client()
+
+# Stripe keeps idempotency keys for 24 hours; never outlive that
+INTENT_TIMEOUT = 60 * 60 * 23
+
+
+def intent_key(user_id):
+    return f'payments:intent:{user_id}'
+
+
+def generation_key(user_id):
+    return f'payments:generation:{user_id}'
+
+
+def cart_fingerprint(user_id, quantities, amount):
+    """
+    Digest of who is paying for what. The per-user generation moves on
+    whenever an order is placed, so buying the same cart again later gets
+    a new intent rather than the one already paid.
+    """
+    payload = json.dumps([
+        user_id,
+        get_version(generation_key(user_id)),
+        sorted(quantities.items()),
+        amount,
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def is_stale(intent, amount):
+    """
+    Whether a PaymentIntent response may not match the live intent for a
+    cart of amount: a replayed idempotent request returns the response
+    Stripe stored the first time, which predates any later update.
+    """
+    response = intent.last_response
+    replayed = response is not None and response.headers.get('Idempotent-Replayed') == 'true'
+    return replayed or intent.amount != amount
+
+
+def update_intent(intent_id, amount, metadata, idempotency_key=None):
+    """Set an open intent's amount; None if it can no longer be changed"""
+    try:
+        intent = stripe.PaymentIntent.modify(
+            intent_id, amount=amount, metadata=metadata, idempotency_key=idempotency_key,
+        )
+        if is_stale(intent, amount):
+            # Setting absolute values is safe to repeat without a key
+            intent = stripe.PaymentIntent.modify(intent_id, amount=amount, metadata=metadata)
+    except stripe.error.InvalidRequestError:
+        return None  # Already paid or cancelled
+    return intent
+
+
+def payment_intent_for_cart(user, quantities, amount, currency='usd'):
+    """
+    Return {'id', 'client_secret', 'fingerprint'} of the PaymentIntent for
+    user's cart of {product id: quantity} costing amount (smallest unit).
+
+    An unchanged cart is answered from the cache with no Stripe call. A
+    changed cart updates the shopper's open intent in place; a new intent
+    is only created when there is none (or it can no longer be changed).
+    Every write carries an idempotency key derived from the fingerprint,
+    so retries and concurrent reloads cannot create duplicates. A replayed
+    response (say the cache was lost and the cart went back to an earlier
+    state) is never trusted for the amount: the intent is updated again.
+    """
+    fingerprint = cart_fingerprint(user.pk, quantities, amount)
+    key = intent_key(user.pk)
+    cached = cache.get(key)
+    if cached is not None and cached['fingerprint'] == fingerprint:
+        return cached
+
+    metadata = {
+        'user_id': user.pk,
+        'user_email': user.email,
+        'cart_fingerprint': fingerprint,
+    }
+    intent = None
+    if cached is not None:
+        intent = update_intent(
+            cached['id'], amount, metadata,
+            idempotency_key=f"pi-update-{cached['id']}-{fingerprint}",
+        )
+    if intent is None:
+        intent = stripe.PaymentIntent.create(
+            amount=amount,
+            currency=currency,
+            metadata=metadata,
+            idempotency_key=f'pi-create-{user.pk}-{fingerprint}',
+        )
+        if is_stale(intent, amount):
+            # The replayed intent may have moved to another cart since, or
+            # been paid; bring it in line or start a fresh one
+            intent = update_intent(intent.id, amount, metadata) or stripe.PaymentIntent.create(
+                amount=amount,
+                currency=currency,
+                metadata=metadata,
+                idempotency_key=f'pi-create-{user.pk}-{fingerprint}-{intent.id}',
+            )
+
+    cached = {'id': intent.id, 'client_secret': intent.client_secret, 'fingerprint': fingerprint}
+    cache.set(key, cached, INTENT_TIMEOUT)
+    return cached
+
+
+# The Stripe round trip runs in a worker thread of its own rather than the
+# shared sync thread, so slow responses never queue other requests
+payment_intent_for_cart_async = sync_to_async(payment_intent_for_cart, thread_sensitive=False)
+
+
+def forget_payment_intent(user_id):
+    """Drop the shopper's open intent once their order is placed"""
+    cache.delete(intent_key(user_id))
+    bump_version(generation_key(user_id))
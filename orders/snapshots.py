@@ -0,0 +1,62 @@
+"""
+Backfill of order line product snapshots
+"""
+import time
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from .models import OrderItem
+
+
+SNAPSHOT_FIELDS = ['product_name', 'product_slug', 'image_url', 'category_name']
+
+
+@dataclass
+class BackfillResult:
+    updated: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.updated / self.seconds if self.seconds else 0.0
+
+
+def missing_snapshots():
+    """Order lines placed before snapshots existed whose product is still around"""
+    return OrderItem.objects.filter(product_name='', product__isnull=False)
+
+
+def backfill_item_snapshots(batch_size=1000, pause=0.0, on_batch=None):
+    """
+    Copy product name, slug, image URL and category name onto order lines
+    that lack them, batch_size lines at a time in primary key order. Each
+    batch is one joined read and one bulk UPDATE in a short transaction.
+    """
+    result = BackfillResult()
+    started = time.monotonic()
+    last_pk = 0
+    while True:
+        items = list(
+            missing_snapshots().filter(pk__gt=last_pk)
+            .select_related('product__category')
+            .order_by('pk')[:batch_size]
+        )
+        if not items:
+            break
+        last_pk = items[-1].pk
+        for item in items:
+            item.copy_product(item.product)
+        with transaction.atomic():
+            OrderItem.objects.bulk_update(items, SNAPSHOT_FIELDS)
+        result.updated += len(items)
+        result.batches += 1
+        result.seconds = time.monotonic() - started
+        if on_batch is not None:
+            on_batch(result)
+        if len(items) < batch_size:
+            break
+        time.sleep(pause)
+    result.seconds = time.monotonic() - started
+    return result
@@ -1,3 +1,560 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+import stripe
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from products.carts import DatabaseCartStorage
+from products.models import Cart, Category, CoPurchase, Product, ProductCard, StockHold
+from products.recommendations import rebuild_index
+from products.reservations import hold_stock
+from products.testing import (
+    CatalogFixtureMixin, CategoryFixtureMixin, IsolatedCachesMixin, make_product,
+)
+
+from .archive import archive_orders
+from .checkout import CheckoutError, InsufficientStock, place_order
+from .fake_stripe import FakeStripe
+from .models import ArchivedOrder, Order, OrderItem, StripeEvent
+from .numbers import encode, next_order_number
+from .payments import (
+    build_http_client, forget_payment_intent, intent_key, payment_intent_for_cart,
+    payment_intent_for_cart_async,
+)
+from .snapshots import backfill_item_snapshots
+from .webhooks import drain_events, process_batch
+
+
+def make_order(user):
+    return Order(
+        user=user, full_name='Jo Shopper', email='jo@example.com', phone='0',
+        address_line_1='1 High St', city='Leeds', state='West Yorkshire', postal_code='LS1',
+    )
+
+
+class PlaceOrderTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+
+    def setUp(self):
+        super().setUp()
+        self.cart = DatabaseCartStorage(None, user=self.user)
+
+    def test_places_order_takes_stock_and_clears_cart(self):
+        self.cart.add(self.boot, 2)
+        self.cart.add(self.sock, 3)
+        order = place_order(make_order(self.user), self.cart)
+        self.assertEqual(str(order.total_amount), '47.48')
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity', 'price')),
+            sorted([(self.boot.pk, 2, Decimal('19.99')), (self.sock.pk, 3, Decimal('2.50'))]),
+        )
+        self.boot.refresh_from_db()
+        self.assertEqual(self.boot.stock, 3)
+        self.assertEqual(ProductCard.objects.get(pk=self.boot.pk).stock, 3)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_statement_count_does_not_grow_with_cart(self):
+        self.cart.add(self.boot, 1)
+        self.cart.add(self.sock, 1)
+        # Number allocation costs differ by backend; keep it out of the count.
+        # Clearing the cart reads its rows for the Cart post_delete receiver.
+        order = make_order(self.user)
+        order.order_number = next_order_number()
+        with self.assertNumQueries(12):
+            place_order(order, self.cart)
+
+        category = Category.objects.create(name='Hats', slug='hats')
+        for i in range(10):
+            self.cart.add(make_product(f'Hat {i}', category, price=5), 1)
+        order = make_order(self.user)
+        order.order_number = next_order_number()
+        with self.assertNumQueries(12):
+            place_order(order, self.cart)
+
+    def test_insufficient_stock_rolls_back(self):
+        self.cart.add(self.boot, 4)
+        self.cart.add(self.sock, 1)
+        Product.objects.filter(pk=self.boot.pk).update(stock=3)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(make_order(self.user), self.cart)
+        self.assertEqual(raised.exception.product, self.boot)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.sock.pk).stock, 50)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_holds_of_other_shoppers_are_respected(self):
+        other = User.objects.create_user('other', password='x')
+        hold_stock(other, {self.boot.pk: 4})
+        self.cart.add(self.boot, 2)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(make_order(self.user), self.cart)
+        self.assertEqual(raised.exception.available, 1)
+
+    def test_own_hold_is_converted(self):
+        self.cart.add(self.boot, 5)
+        hold_stock(self.user, {self.boot.pk: 5})
+        place_order(make_order(self.user), self.cart)
+        self.assertFalse(StockHold.objects.exists())
+        self.assertEqual(ProductCard.objects.get(pk=self.boot.pk).stock, 0)
+
+    def test_empty_cart(self):
+        with self.assertRaises(CheckoutError):
+            place_order(make_order(self.user), self.cart)
+
+
+class OrderNumberTests(IsolatedCachesMixin, TestCase):
+    def test_encoding_is_fixed_width_and_sorts_like_the_value(self):
+        values = [0, 1, 31, 32, 1000, 32 ** 8 - 1]
+        encoded = [encode(value) for value in values]
+        self.assertEqual({len(code) for code in encoded}, {8})
+        self.assertEqual(sorted(encoded), encoded)
+        with self.assertRaises(OverflowError):
+            encode(32 ** 8)
+
+    def test_numbers_are_unique_and_ordered(self):
+        numbers = [next_order_number() for _ in range(50)]
+        self.assertEqual(len(set(numbers)), 50)
+        self.assertEqual(sorted(number[:12] for number in numbers), [n[:12] for n in numbers])
+
+    def test_saved_orders_get_numbers(self):
+        user = User.objects.create_user('shopper', password='x')
+        first = make_order(user)
+        first.total_amount = 10
+        first.save()
+        second = make_order(user)
+        second.total_amount = 10
+        second.save()
+        self.assertRegex(first.order_number, r'^ORD-[0-9A-HJKMNP-TV-Z]{11}$')
+        self.assertLess(first.order_number[:12], second.order_number[:12])
+
+
+class OrderHistoryQueryTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    # Every request: session load, user, and the session save (SAVEPOINT,
+    # UPDATE, RELEASE); on top of that the views' own fixed budgets
+    overhead = 5
+    list_queries = overhead + 2  # COUNT(*) and one page of orders
+    detail_queries = overhead + 1  # The order
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def place(self, lines):
+        cart = DatabaseCartStorage(None, user=self.user)
+        for i in range(lines):
+            product = make_product(f'Boot {Product.objects.count()}', self.category)
+            cart.add(product, 2)
+        return place_order(make_order(self.user), cart)
+
+    def assertBudget(self, url, queries):
+        self.client.get(url)  # Warm the cart badge counter
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_order_list_budget_does_not_grow_with_items(self):
+        self.place(1)
+        self.assertBudget(reverse('orders:order_list'), self.list_queries)
+        for _ in range(5):
+            self.place(8)
+        self.assertBudget(reverse('orders:order_list'), self.list_queries)
+
+    def test_order_detail_budget_does_not_grow_with_items(self):
+        small, large = self.place(1), self.place(12)
+        self.assertBudget(reverse('orders:order_detail', args=[small.order_number]), self.detail_queries)
+        response = self.client.get(reverse('orders:order_detail', args=[large.order_number]))
+        self.assertContains(response, 'Boot 12')
+        self.assertBudget(reverse('orders:order_detail', args=[large.order_number]), self.detail_queries)
+
+    def test_snapshot_and_count_are_stored_at_checkout(self):
+        order = self.place(3)
+        self.assertEqual(order.item_count, 6)
+        self.assertEqual([line['quantity'] for line in order.line_snapshot], [2, 2, 2])
+        self.assertEqual(order.line_snapshot[0]['category'], 'Shoes')
+        self.assertEqual(order.line_snapshot[0]['total'], '20.00')
+
+
+class OrderItemSnapshotTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+
+    def place(self):
+        cart = DatabaseCartStorage(None, user=self.user)
+        cart.add(self.boot, 2)
+        return place_order(make_order(self.user), cart)
+
+    def test_deleting_a_product_keeps_its_order_lines(self):
+        order = self.place()
+        self.boot.delete()
+        item = OrderItem.objects.get(order=order)
+        self.assertIsNone(item.product_id)
+        self.assertEqual((item.product_name, item.category_name), ('Boot', 'Shoes'))
+        self.assertEqual(item.total_price, Decimal('39.98'))
+
+    def test_backfill_fills_lines_without_snapshots(self):
+        order = self.place()
+        OrderItem.objects.update(product_name='', product_slug='', category_name='')
+        result = backfill_item_snapshots(batch_size=1)
+        self.assertEqual((result.updated, result.batches), (1, 1))
+        item = OrderItem.objects.get(order=order)
+        self.assertEqual((item.product_name, item.product_slug, item.category_name),
+                         ('Boot', 'boot', 'Shoes'))
+        self.assertEqual(backfill_item_snapshots().updated, 0)
+
+    def test_backfill_command_reports_progress(self):
+        self.place()
+        OrderItem.objects.update(product_name='')
+        out = StringIO()
+        call_command('backfill_order_snapshots', '--batch-size', '10', stdout=out)
+        self.assertIn('Filled 1 order lines', out.getvalue())
+        self.assertFalse(OrderItem.objects.filter(product_name='').exists())
+
+    def test_admin_order_page_renders_after_product_delete(self):
+        order = self.place()
+        self.boot.delete()
+        User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.login(username='admin', password='x')
+        response = self.client.get(reverse('admin:orders_order_change', args=[order.pk]))
+        self.assertContains(response, 'Boot')
+
+
+class OrderArchiveTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+        cls.product = make_product('Boot', cls.category, stock=100)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def place(self, days_ago):
+        cart = DatabaseCartStorage(None, user=self.user)
+        cart.add(self.product, 1)
+        order = place_order(make_order(self.user), cart)
+        created_at = timezone.now() - timedelta(days=days_ago)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        return order
+
+    def test_old_orders_move_to_the_archive(self):
+        old = [self.place(400), self.place(100)]
+        recent = self.place(1)
+        result = archive_orders(days=30, batch_size=1, pause=0)
+        self.assertEqual((result.archived, result.batches), (2, 2))
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(OrderItem.objects.count(), 1)
+        archived = ArchivedOrder.objects.get(pk=old[0].pk)
+        self.assertEqual(archived.order_number, old[0].order_number)
+        self.assertEqual(archived.line_snapshot, old[0].line_snapshot)
+        self.assertEqual(archive_orders(days=30, pause=0).archived, 0)
+
+    def test_order_list_pages_across_hot_and_archived(self):
+        orders = [self.place(days) for days in range(200, 185, -1)]
+        archive_orders(days=191, pause=0)
+        self.assertEqual(ArchivedOrder.objects.count(), 10)
+        expected = [order.order_number for order in reversed(orders)]
+        seen = []
+        for page in (1, 2):
+            response = self.client.get(reverse('orders:order_list'), {'page': page})
+            seen += [order.order_number for order in response.context['orders']]
+        self.assertEqual(seen, expected)
+
+    def test_archived_order_detail_and_admin(self):
+        order = self.place(400)
+        archive_orders(days=30, pause=0)
+        url = reverse('orders:order_detail', args=[order.order_number])
+        self.assertContains(self.client.get(url), 'Boot')
+        User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.login(username='admin', password='x')
+        self.assertContains(self.client.get(reverse('admin:orders_archivedorder_changelist')),
+                            order.order_number)
+        response = self.client.get(reverse('admin:orders_archivedorder_change', args=[order.pk]))
+        self.assertContains(response, 'Boot (Shoes) x 1')
+
+    def test_archived_orders_still_feed_recommendations(self):
+        sock = make_product('Sock', self.category, stock=100)
+        hat = make_product('Hat', self.category, stock=100)
+        for extra in (sock, hat):
+            cart = DatabaseCartStorage(None, user=self.user)
+            cart.add(self.product, 1)
+            cart.add(extra, 1)
+            order = place_order(make_order(self.user), cart)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=400))
+        archive_orders(days=30, pause=0)
+        self.assertFalse(OrderItem.objects.exists())
+        hat.delete()
+        self.assertEqual(rebuild_index(), (2, 2))
+        self.assertEqual(
+            set(CoPurchase.objects.values_list('product_id', 'other_id', 'count')),
+            {(self.product.pk, sock.pk, 1), (sock.pk, self.product.pk, 1)},
+        )
+
+    def test_command_reports_archived_orders(self):
+        self.place(400)
+        out = StringIO()
+        call_command('archive_orders', '--days', '30', '--pause', '0', stdout=out)
+        self.assertIn('Archived 1 orders', out.getvalue())
+
+
+class PaymentIntentTests(IsolatedCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('shopper', email='jo@example.com', password='x')
+        self.stripe = FakeStripe().start()
+        self.addCleanup(self.stripe.stop)
+        api_base, stripe.api_base = stripe.api_base, self.stripe.url
+        self.addCleanup(setattr, stripe, 'api_base', api_base)
+
+    def creates(self):
+        return self.stripe.count('POST', '/v1/payment_intents')
+
+    def test_unchanged_cart_reuses_intent_without_calling_stripe(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        second = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.stripe.requests), 1)
+
+    def test_changed_cart_updates_open_intent(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        second = payment_intent_for_cart(self.user, {1: 3}, 3000)
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(self.creates(), 1)
+        self.assertEqual(self.stripe.intents[first['id']]['amount'], 3000)
+
+    def test_lost_intent_cache_replays_idempotent_create(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        cache.delete(intent_key(self.user.pk))
+        second = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.assertEqual(first['id'], second['id'])
+        self.assertEqual(len(self.stripe.intents), 1)
+
+    def test_replayed_create_after_cart_round_trip_gets_current_amount(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        payment_intent_for_cart(self.user, {1: 3}, 3000)
+        cache.delete(intent_key(self.user.pk))
+        # Back to the first cart: the create is replayed with its old body
+        again = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.assertEqual(again['id'], first['id'])
+        self.assertEqual(self.stripe.intents[first['id']]['amount'], 2000)
+        self.assertEqual(self.creates(), 2)  # The original and the replay
+
+    def test_replayed_update_after_cart_round_trip_gets_current_amount(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        payment_intent_for_cart(self.user, {1: 3}, 3000)
+        payment_intent_for_cart(self.user, {1: 4}, 4000)
+        payment_intent_for_cart(self.user, {1: 3}, 3000)
+        self.assertEqual(self.stripe.intents[first['id']]['amount'], 3000)
+
+    def test_replayed_create_of_a_paid_intent_starts_a_new_one(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        payment_intent_for_cart(self.user, {1: 3}, 3000)
+        self.stripe.succeed(first['id'])
+        cache.delete(intent_key(self.user.pk))
+        again = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.assertNotEqual(again['id'], first['id'])
+        self.assertEqual(self.stripe.intents[again['id']]['amount'], 2000)
+
+    def test_same_cart_after_order_gets_new_intent(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.stripe.succeed(first['id'])
+        forget_payment_intent(self.user.pk)
+        second = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.assertNotEqual(first['id'], second['id'])
+
+    def test_paid_intent_is_replaced_rather_than_updated(self):
+        first = payment_intent_for_cart(self.user, {1: 2}, 2000)
+        self.stripe.succeed(first['id'])
+        second = payment_intent_for_cart(self.user, {1: 3}, 3000)
+        self.assertNotEqual(first['id'], second['id'])
+        self.assertEqual(self.stripe.intents[first['id']]['amount'], 2000)
+
+
+class StripeClientTests(IsolatedCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.stripe = FakeStripe().start()
+        self.addCleanup(self.stripe.stop)
+        saved = stripe.api_base, stripe.default_http_client, stripe.max_network_retries
+        self.addCleanup(self.restore, *saved)
+        stripe.api_base = self.stripe.url
+        stripe.default_http_client = build_http_client(connect_timeout=1, read_timeout=0.5)
+        stripe.max_network_retries = 1
+
+    def restore(self, api_base, http_client, max_network_retries):
+        stripe.api_base = api_base
+        stripe.default_http_client = http_client
+        stripe.max_network_retries = max_network_retries
+
+    def shopper(self, name='shopper'):
+        return User.objects.create_user(name, email=f'{name}@example.com', password='x')
+
+    def test_slow_stripe_times_out_within_retry_budget(self):
+        user = self.shopper()
+        self.stripe.latency = 5
+        started = time.monotonic()
+        with self.assertRaises(stripe.error.APIConnectionError):
+            payment_intent_for_cart(user, {1: 1}, 1000)
+        # Two attempts of 0.5s plus backoff, well short of the latency
+        self.assertLess(time.monotonic() - started, 3)
+
+    def test_server_errors_are_retried_with_the_same_idempotency_key(self):
+        self.stripe.fail_next = 1
+        intent = payment_intent_for_cart(self.shopper(), {1: 1}, 1000)
+        self.assertEqual(intent['id'], 'pi_fake000001')
+        (_, _, first_key), (_, _, second_key) = self.stripe.requests
+        self.assertEqual(first_key, second_key)
+
+    async def test_async_intents_do_not_wait_on_each_other(self):
+        self.stripe.latency = 0.2
+        shoppers = [await sync_to_async(self.shopper)(f'shopper-{i}') for i in range(6)]
+        started = time.monotonic()
+        intents = await asyncio.gather(*[
+            payment_intent_for_cart_async(user, {1: 1}, 1000) for user in shoppers
+        ])
+        self.assertLess(time.monotonic() - started, 6 * 0.2)
+        self.assertEqual(len({intent['id'] for intent in intents}), 6)
+
+    async def test_async_view(self):
+        category = await Category.objects.acreate(name='Shoes', slug='shoes')
+        boot = await Product.objects.acreate(
+            name='Boot', slug='boot', category=category,
+            description='A boot', price=10, stock=5,
+        )
+        user = await sync_to_async(self.shopper)()
+        await Cart.objects.acreate(user=user, product=boot, quantity=2)
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.post(reverse('orders:create_payment_intent_async'))
+        self.assertEqual(response.json(), {'client_secret': 'pi_fake000001_secret_fake'})
+        self.assertEqual(await StockHold.objects.filter(user=user).acount(), 1)
+        self.assertEqual(self.stripe.intents['pi_fake000001']['amount'], 2000)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class StripeWebhookTests(IsolatedCachesMixin, TestCase):
+    orders = 600
+
+    def setUp(self):
+        super().setUp()
+        self.stripe = FakeStripe()  # Only signs deliveries; no server needed
+        self.user = User.objects.create_user('shopper', password='x')
+
+    def deliver(self, payload, signature):
+        return self.client.post(
+            reverse('orders:stripe_webhook'), payload,
+            content_type='application/json', HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def make_orders(self, count):
+        orders = [make_order(self.user) for _ in range(count)]
+        for i, order in enumerate(orders):
+            order.order_number = f'ORD-T{i:06d}'
+            order.total_amount = 10
+            order.stripe_payment_intent = f'pi_test{i:06d}'
+        return Order.objects.bulk_create(orders)
+
+    def test_bad_signature_is_rejected(self):
+        payload, _ = self.stripe.webhook('payment_intent.succeeded', 'pi_x', 'whsec_test')
+        self.assertEqual(self.deliver(payload, 't=1,v1=bad').status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_delivery_only_queues_the_event(self):
+        order, = self.make_orders(1)
+        delivery = self.stripe.webhook('payment_intent.succeeded', order.stripe_payment_intent, 'whsec_test')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.deliver(*delivery).status_code, 200)
+        self.assertEqual(Order.objects.get().payment_status, 'pending')
+        self.assertEqual(process_batch(), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'paid')
+        self.assertIsNotNone(order.paid_at)
+
+    def test_replayed_load_is_deduplicated_and_applied_in_batches(self):
+        orders = self.make_orders(self.orders)
+        deliveries = []
+        for order in orders:
+            intent = order.stripe_payment_intent
+            deliveries.append(self.stripe.webhook('payment_intent.payment_failed', intent, 'whsec_test'))
+            deliveries.append(self.stripe.webhook('payment_intent.succeeded', intent, 'whsec_test'))
+        # Every event twice, then the failures again late and out of order
+        deliveries = deliveries * 2 + deliveries[::2][::-1]
+        for delivery in deliveries:
+            self.assertEqual(self.deliver(*delivery).status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), self.orders * 2)
+
+        # SAVEPOINT, select, one UPDATE (every intent ends paid), mark done, RELEASE
+        with self.assertNumQueries(5):
+            process_batch(batch_size=self.orders * 2)
+        self.assertEqual(
+            set(Order.objects.values_list('payment_status', flat=True)), {'paid'}
+        )
+
+        # A failure arriving after processing never undoes a payment
+        self.deliver(*self.stripe.webhook(
+            'payment_intent.payment_failed', orders[0].stripe_payment_intent, 'whsec_test'
+        ))
+        result = drain_events(batch_size=100)
+        self.assertEqual(result.processed, 1)
+        self.assertEqual(Order.objects.filter(payment_status='paid').count(), self.orders)
+
+
+class PlaceOrderConcurrencyTests(IsolatedCachesMixin, TransactionTestCase):
+    shoppers = 12
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_checkouts_never_oversell(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = make_product('Boot', category, stock=20)
+        users = []
+        for i in range(self.shoppers):
+            user = User.objects.create_user(f'shopper-{i}', password='x')
+            DatabaseCartStorage(None, user=user).add(product, 3)
+            users.append(user)
+
+        barrier = threading.Barrier(self.shoppers)
+        outcomes = []
+        errors = []
+
+        def worker(user):
+            try:
+                barrier.wait()
+                place_order(make_order(user), DatabaseCartStorage(None, user=user))
+                outcomes.append('placed')
+            except CheckoutError:
+                outcomes.append('rejected')
+            except Exception as exc:  # surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(user,)) for user in users]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count('placed'), 6)
+        product.refresh_from_db()
+        sold = OrderItem.objects.aggregate(sold=Sum('quantity'))['sold']
+        self.assertEqual((product.stock, sold), (2, 18))
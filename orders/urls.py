@@ -10,6 +10,8 @@ urlpatterns = [
     # Checkout
     path('checkout/', views.checkout, name='checkout'),
     path('create-payment-intent/', views.create_payment_intent, name='create_payment_intent'),
+    path('create-payment-intent/async/', views.create_payment_intent_async,
+         name='create_payment_intent_async'),
     
     # Orders
     path('success/<str:order_number>/', views.order_success, name='order_success'),
@@ -6,28 +6,34 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from asgiref.sync import sync_to_async
 import stripe
 import json
 
-from .models import Order, OrderItem
+from .archive import OrderHistory, get_user_order
+from .checkout import CheckoutError, place_order
+from .models import Order
+from .payments import (
+    forget_payment_intent, payment_intent_for_cart, payment_intent_for_cart_async,
+)
 from .forms import CheckoutForm
-from products.models import Cart
-
-
-# Configure Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from .webhooks import record_event
+from products.carts import get_cart
+from products.recommendations import record_order
+from products.reservations import hold_stock, release_holds
 
 
 @login_required
 def checkout(request):
     """Checkout page with payment form"""
     # Get cart items
-    cart_items = Cart.objects.filter(user=request.user).select_related('product')
+    cart = get_cart(request)
+    cart_items = cart.lines()
     
-    if not cart_items.exists():
+    if not cart_items:
         messages.warning(request, 'Your cart is empty.')
         return redirect('products:cart')
     
@@ -41,8 +47,7 @@ def checkout(request):
             return redirect('products:cart')
     
     # Calculate totals
-    subtotal = sum(item.total_price for item in cart_items)
-    total = subtotal  # No tax
+    totals = cart.totals()
     
     if request.method == 'POST':
         form = CheckoutForm(request.POST, user=request.user)
@@ -55,30 +60,22 @@ def checkout(request):
                 messages.error(request, 'Payment failed. Please try again.')
                 return redirect('orders:checkout')
             
-            # Create order
+            # Create order, take stock and clear the cart in one transaction
             order = form.save(commit=False)
             order.user = request.user
-            order.total_amount = total
             order.stripe_payment_intent = payment_intent_id
             order.payment_status = 'paid'
             order.paid_at = timezone.now()
-            order.save()
+            try:
+                place_order(order, cart)
+            except CheckoutError as e:
+                messages.error(request, str(e))
+                return redirect('products:cart')
             
-            # Create order items
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
-                )
-                
-                # Update product stock
-                cart_item.product.stock -= cart_item.quantity
-                cart_item.product.save()
+            forget_payment_intent(request.user.pk)
             
-            # Clear cart
-            cart_items.delete()
+            # Feed the "frequently bought together" index
+            record_order([item.product_id for item in cart_items])
             
             messages.success(request, 'Order placed successfully!')
             return redirect('orders:order_success', order_number=order.order_number)
@@ -88,43 +85,55 @@ def checkout(request):
     context = {
         'form': form,
         'cart_items': cart_items,
-        'subtotal': subtotal,
-        'total': total,
+        'subtotal': totals.subtotal,
+        'total': totals.total,
         'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
     }
     return render(request, 'orders/checkout.html', context)
 
 
+def prepare_payment(request):
+    """
+    Check the cart and hold its stock for payment. Returns an error
+    JsonResponse, or (quantities, amount in cents) to create the intent for.
+    """
+    # One aggregate query; no cart lines are loaded
+    cart = get_cart(request)
+    totals = cart.totals()
+    
+    if totals.is_empty:
+        return JsonResponse({'error': 'Cart is empty'}, status=400)
+    
+    # Hold the cart's stock while the customer pays
+    quantities = cart.quantities()
+    shortfalls = hold_stock(request.user, quantities)
+    if shortfalls:
+        product, available = next(iter(shortfalls.items()))
+        return JsonResponse({
+            'error': f'{product.name} has only {available} items in stock.'
+        }, status=409)
+    
+    return quantities, totals.total_in_cents
+
+
 @login_required
 def create_payment_intent(request):
     """Create Stripe Payment Intent"""
     if request.method == 'POST':
         try:
-            # Get cart items
-            cart_items = Cart.objects.filter(user=request.user).select_related('product')
-            
-            if not cart_items.exists():
-                return JsonResponse({'error': 'Cart is empty'}, status=400)
+            prepared = prepare_payment(request)
+            if isinstance(prepared, JsonResponse):
+                return prepared
             
-            # Calculate total
-            subtotal = sum(item.total_price for item in cart_items)
-            total = subtotal  # No tax
-            
-            # Convert to cents for Stripe
-            amount = int(total * 100)
-            
-            # Create Payment Intent
-            intent = stripe.PaymentIntent.create(
-                amount=amount,
-                currency='usd',
-                metadata={
-                    'user_id': request.user.id,
-                    'user_email': request.user.email,
-                }
-            )
+            # Reuse or update the cart's Payment Intent (amount in cents)
+            try:
+                intent = payment_intent_for_cart(request.user, *prepared)
+            except Exception:
+                release_holds(request.user)
+                raise
             
             return JsonResponse({
-                'client_secret': intent.client_secret
+                'client_secret': intent['client_secret']
             })
             
         except Exception as e:
@@ -133,6 +142,39 @@ def create_payment_intent(request):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
+async def create_payment_intent_async(request):
+    """
+    create_payment_intent for ASGI deployments: the database work runs on
+    the sync thread, while the Stripe round trip is awaited off the event
+    loop so a slow Stripe holds no worker.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    
+    # Resolving the lazy user touches the session and database
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    try:
+        prepared = await sync_to_async(prepare_payment)(request)
+        if isinstance(prepared, JsonResponse):
+            return prepared
+        
+        try:
+            intent = await payment_intent_for_cart_async(user, *prepared)
+        except Exception:
+            await sync_to_async(release_holds)(user)
+            raise
+        
+        return JsonResponse({
+            'client_secret': intent['client_secret']
+        })
+    
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
 @login_required
 def order_success(request, order_number):
     """Order confirmation page"""
@@ -147,7 +189,11 @@ def order_success(request, order_number):
 @login_required
 def order_list(request):
     """Display user's orders"""
-    orders = Order.objects.filter(user=request.user).prefetch_related('items__product')
+    # Counts and line snapshots live on the order row; no item queries.
+    # Archived orders follow the hot ones.
+    orders = OrderHistory(
+        request.user, defer=['admin_notes', 'customer_notes', 'stripe_payment_intent']
+    )
     
     # Pagination
     paginator = Paginator(orders, 10)
@@ -163,11 +209,9 @@ def order_list(request):
 @login_required
 def order_detail(request, order_number):
     """Display single order details"""
-    order = get_object_or_404(
-        Order,
-        order_number=order_number,
-        user=request.user
-    )
+    order = get_user_order(request.user, order_number)
+    if order is None:
+        raise Http404('No such order.')
     
     context = {
         'order': order,
@@ -177,12 +221,12 @@ def order_detail(request, order_number):
 
 @csrf_exempt
 def stripe_webhook(request):
-    """Handle Stripe webhooks"""
+    """Verify Stripe webhooks and queue them for process_stripe_events"""
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError:
@@ -190,28 +234,7 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError:
         return JsonResponse({'error': 'Invalid signature'}, status=400)
     
-    # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        
-        # Update order payment status
-        try:
-            order = Order.objects.get(stripe_payment_intent=payment_intent['id'])
-            order.payment_status = 'paid'
-            order.paid_at = timezone.now()
-            order.save()
-        except Order.DoesNotExist:
-            pass
-    
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        
-        # Update order payment status
-        try:
-            order = Order.objects.get(stripe_payment_intent=payment_intent['id'])
-            order.payment_status = 'failed'
-            order.save()
-        except Order.DoesNotExist:
-            pass
+    # One INSERT; redeliveries are dropped and processing happens later
+    record_event(json.loads(payload))
     
-    return JsonResponse({'status': 'success'})
\ No newline at end of file
+    return JsonResponse({'status': 'success'})
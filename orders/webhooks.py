@@ -0,0 +1,108 @@
+"""
+Stripe webhook inbox and its batched processing
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order, StripeEvent
+
+
+# Event type -> (new payment status, statuses it may replace). A late
+# failure never overrides a payment that went through.
+TRANSITIONS = {
+    'payment_intent.succeeded': ('paid', ['pending', 'failed']),
+    'payment_intent.payment_failed': ('failed', ['pending']),
+}
+
+
+def record_event(event):
+    """
+    Store a verified event (as decoded JSON) in the inbox. A redelivered
+    event id is ignored by the insert itself, without a lookup first.
+    """
+    obj = event['data']['object']
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(
+            id=event['id'],
+            type=event['type'],
+            payment_intent=obj.get('id', '') if obj.get('object') == 'payment_intent' else '',
+            created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+            payload=event,
+        )],
+        ignore_conflicts=True,
+    )
+
+
+def process_batch(batch_size=500):
+    """
+    Apply the oldest batch_size unprocessed events and mark them done, in
+    one transaction. Only the last event per payment intent counts, and
+    each status transition is a single UPDATE over the indexed
+    stripe_payment_intent column. Concurrent workers skip each other's
+    locked events. Returns the number of events processed.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.filter(processed_at__isnull=True)
+            .select_for_update(skip_locked=True)
+            .only('id', 'type', 'payment_intent')
+            .order_by('created', 'received_at')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        latest = {}
+        for event in events:
+            if event.type in TRANSITIONS and event.payment_intent:
+                latest[event.payment_intent] = event.type
+
+        now = timezone.now()
+        for event_type, (status, from_statuses) in TRANSITIONS.items():
+            intents = [intent for intent, last in latest.items() if last == event_type]
+            if not intents:
+                continue
+            changes = {'payment_status': status, 'updated_at': now}
+            if status == 'paid':
+                changes['paid_at'] = Coalesce('paid_at', Value(now))
+            Order.objects.filter(
+                stripe_payment_intent__in=intents,
+                payment_status__in=from_statuses,
+            ).update(**changes)
+
+        StripeEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=now)
+    return len(events)
+
+
+@dataclass
+class DrainResult:
+    processed: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def events_per_second(self):
+        return self.processed / self.seconds if self.seconds else 0.0
+
+
+def drain_events(batch_size=500, on_batch=None):
+    """Process batches until the inbox is empty"""
+    result = DrainResult()
+    started = time.monotonic()
+    while True:
+        processed = process_batch(batch_size)
+        if processed:
+            result.processed += processed
+            result.batches += 1
+            result.seconds = time.monotonic() - started
+            if on_batch is not None:
+                on_batch(result)
+        if processed < batch_size:
+            break
+    result.seconds = time.monotonic() - started
+    return result
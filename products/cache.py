@@ -0,0 +1,124 @@
+"""
+Versioned fragment cache for catalog pages
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache, caches
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.template.loader import render_to_string
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATEGORY_VERSION_KEY = 'catalog:categories:version'
+
+
+def get_version(key):
+    """Return the current value of a version counter, seeding it if missing"""
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost counter never reuses an old version
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Move a version counter forward, invalidating whatever it keys"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_version(key)
+
+
+def _read_counter(key):
+    from .models import VersionCounter
+    return VersionCounter.objects.filter(key=key).values_list('value', flat=True).first()
+
+
+def _seed_counter(key):
+    from .models import VersionCounter
+    # Seed from the clock so a lost row never reuses an old version
+    VersionCounter.objects.get_or_create(key=key, defaults={'value': int(time.time() * 1000)})
+    return _read_counter(key)
+
+
+def get_counter(key):
+    """
+    Return the current value of a database-backed version counter. Reads
+    are served from the cache mirror; only a missing mirror costs SQL.
+    """
+    value = cache.get(key)
+    if value is None:
+        value = _read_counter(key)
+        if value is None:
+            value = _seed_counter(key)
+        # add, not set: never overwrite a newer value mirrored by a bump
+        cache.add(key, value, timeout=None)
+        value = cache.get(key, value)
+    return value
+
+
+def bump_counter(key):
+    """
+    Atomically move a database-backed version counter forward and mirror
+    the new value into the cache. The counter moves to the current time in
+    milliseconds (or one past its old value, if that is later), so a
+    version doubles as the time of the last change. Mirror writes from concurrent bumps can
+    arrive out of order, so the row is re-read after each write until the
+    mirror holds the latest value and never ends up behind it.
+    """
+    from .models import VersionCounter
+    bumped = Greatest(F('value') + 1, Value(int(time.time() * 1000)))
+    if VersionCounter.objects.filter(key=key).update(value=bumped):
+        value = _read_counter(key)
+    else:
+        value = _seed_counter(key)
+    while True:
+        cache.set(key, value, timeout=None)
+        latest = _read_counter(key)
+        if latest == value:
+            return value
+        value = latest
+
+
+def get_catalog_version():
+    """Return the current catalog version"""
+    return get_counter(CATALOG_VERSION_KEY)
+
+
+def catalog_modified():
+    """When the catalog last changed, as an aware datetime"""
+    return datetime.fromtimestamp(get_catalog_version() / 1000, tz=timezone.utc)
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog fragment by moving to a new version"""
+    return bump_counter(CATALOG_VERSION_KEY)
+
+
+def fragment_key(namespace, request, *parts):
+    """Cache key for a fragment, unique per catalog version and query string"""
+    params = sorted(request.GET.lists())
+    signature = hashlib.md5(
+        repr((request.path, params, parts)).encode()
+    ).hexdigest()
+    return f'catalog:{namespace}:{get_catalog_version()}:{signature}'
+
+
+def cached_fragment(namespace, request, template_name, get_context, *parts):
+    """
+    Render template_name with get_context() unless a copy for this catalog
+    version and filter/sort/page signature is cached. get_context is only
+    called on a miss, so a hit issues no catalog queries at all. Eviction
+    is LRU/TTL as configured on the 'catalog' cache alias.
+    """
+    fragment_cache = caches['catalog']
+    key = fragment_key(namespace, request, *parts)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_to_string(template_name, get_context())
+        fragment_cache.set(key, html)
+    return html
@@ -0,0 +1,29 @@
+"""
+Cache backends for data that lives nowhere else
+"""
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class CartFileCache(FileBasedCache):
+    """
+    File cache that never culls. The stock FileBasedCache lists its whole
+    directory on every set() and, once MAX_ENTRIES is reached, deletes a
+    random third of the entries; for anonymous carts, which exist only in
+    this cache, that drops real shoppers' carts. Here entries only go away
+    when they expire: on the next read, or in delete_expired() (run by
+    purge_stale).
+    """
+
+    def _cull(self):
+        pass
+
+    def delete_expired(self):
+        """Delete every expired entry; returns the number deleted"""
+        deleted = 0
+        for fname in self._list_cache_files():
+            try:
+                with open(fname, 'rb') as f:
+                    deleted += self._is_expired(f)
+            except FileNotFoundError:
+                pass  # Deleted by a concurrent read or sweep
+        return deleted
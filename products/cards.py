@@ -0,0 +1,107 @@
+"""
+Maintenance of the ProductCard listing read model
+"""
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from .models import Product, ProductCard, StockHold
+
+
+CARD_FIELDS = [
+    'slug', 'name', 'summary', 'price', 'category', 'category_name',
+    'category_slug', 'image_url', 'stock', 'available', 'created_at',
+]
+
+
+def build_card(product, category=None):
+    """Project a product (with its category) onto an unsaved ProductCard"""
+    category = category or product.category
+    return ProductCard(
+        id=product.pk,
+        slug=product.slug,
+        name=product.name,
+        summary=Truncator(product.description).chars(300),
+        price=product.price,
+        category=category,
+        category_name=category.name,
+        category_slug=category.slug,
+        image_url=product.image.url if product.image else '',
+        stock=product.stock,
+        available=product.available,
+        created_at=product.created_at,
+    )
+
+
+def sync_product_card(product):
+    """Insert or refresh the listing card for a single product"""
+    build_card(product).save()
+    refresh_card_stock([product.pk])
+
+
+def refresh_card_stock(product_ids):
+    """
+    Set the cards' stock to available-to-sell: stock on hand less active
+    holds, in one UPDATE, so listings need no extra query to show it.
+    """
+    on_hand = Product.objects.filter(pk=OuterRef('pk')).values('stock')[:1]
+    held = (
+        StockHold.objects.filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+        .values('product').annotate(total=Sum('quantity')).values('total')
+    )
+    return ProductCard.objects.filter(pk__in=list(product_ids)).update(stock=Greatest(
+        Subquery(on_hand) - Coalesce(Subquery(held), 0),
+        Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def sync_category_cards(category):
+    """Copy category name/slug onto every card in the category"""
+    return ProductCard.objects.filter(category=category).update(
+        category_name=category.name,
+        category_slug=category.slug,
+    )
+
+
+def rebuild_product_cards(batch_size=1000, product_ids=None):
+    """
+    Rebuild cards from the catalog in batches, upserting each batch with
+    a single statement. A full rebuild also drops cards of deleted products.
+    """
+    products = Product.objects.select_related('category').order_by('pk')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    count = 0
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(build_card(product))
+        if len(batch) >= batch_size:
+            count += _upsert(batch)
+            batch = []
+    if batch:
+        count += _upsert(batch)
+
+    if product_ids is None:
+        ProductCard.objects.exclude(pk__in=Product.objects.values('pk')).delete()
+    return count
+
+
+def _upsert(cards):
+    ProductCard.objects.bulk_create(
+        cards,
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=CARD_FIELDS,
+    )
+    refresh_card_stock([card.pk for card in cards])
+    return len(cards)
+
+
+def cards_in_order(ids):
+    """Load cards for an ordered list of product ids, preserving that order"""
+    ids = list(ids)
+    cards = ProductCard.objects.in_bulk(ids)
+    return [cards[pk] for pk in ids if pk in cards]
@@ -0,0 +1,435 @@
+"""
+Pluggable shopping cart storage
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cart, Product
+from .pricing import database_cart_totals, quantities_totals
+
+
+class CartLine:
+    """One product line of a non-database cart, shaped like a Cart row"""
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.product_id = product.pk
+        self.quantity = quantity
+
+    @property
+    def total_price(self):
+        """Calculate total price for this cart line"""
+        return self.product.price * self.quantity
+
+
+def add_cart_line(user_id, product_id, quantity):
+    """
+    Add quantity of a product to a user's cart in one INSERT ... ON CONFLICT
+    DO UPDATE statement. The increment and the stock cap are computed in
+    SQL, so concurrent adds to the same line can neither lose updates nor
+    push the line past stock.
+
+    Returns (new quantity, created), or (0, False) when the product does
+    not exist or is out of stock.
+    """
+    cart_table = connection.ops.quote_name(Cart._meta.db_table)
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+    added_at = Cart._meta.get_field('added_at').get_db_prep_value(
+        timezone.now(), connection
+    )
+    sql = (
+        f'INSERT INTO {cart_table} (user_id, product_id, quantity, added_at) '
+        f'SELECT %s, id, {least}(%s, stock), %s FROM {product_table} '
+        f'WHERE id = %s AND stock > 0 '
+        f'ON CONFLICT (user_id, product_id) DO UPDATE SET quantity = {least}('
+        f'{cart_table}.quantity + EXCLUDED.quantity, '
+        f'(SELECT stock FROM {product_table} WHERE id = EXCLUDED.product_id)) '
+        # An existing line keeps its original added_at
+        f'RETURNING quantity, added_at = %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, quantity, added_at, product_id, added_at])
+        row = cursor.fetchone()
+    if row is None:
+        return 0, False
+    return row[0], bool(row[1])
+
+
+def set_cart_line_quantity(user_id, product_id, quantity):
+    """
+    Set an existing cart line's quantity, capped at stock in SQL, with one
+    UPDATE ... RETURNING. A line whose product has run out of stock is
+    deleted instead of being left at zero.
+
+    Returns the quantity written (0 if the line was deleted), or None when
+    the user has no line for the product.
+    """
+    cart_table = connection.ops.quote_name(Cart._meta.db_table)
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    least = 'MIN' if connection.vendor == 'sqlite' else 'LEAST'
+    sql = (
+        f'UPDATE {cart_table} SET quantity = {least}(%s, '
+        f'(SELECT stock FROM {product_table} WHERE id = {cart_table}.product_id)) '
+        f'WHERE user_id = %s AND product_id = %s '
+        f'RETURNING quantity'
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [quantity, user_id, product_id])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        if row[0] <= 0:
+            Cart.objects.filter(user_id=user_id, product_id=product_id).delete()
+            return 0
+    return row[0]
+
+
+def cart_count_key(user_id):
+    """'carts' cache key of a database cart's cached line count"""
+    return f'cart:count:{user_id}'
+
+
+def forget_cart_counts(user_ids):
+    """
+    Drop users' cached line counts once the current transaction commits,
+    so no render in between can recount the old rows and cache them.
+    """
+    keys = [cart_count_key(user_id) for user_id in set(user_ids)]
+    transaction.on_commit(lambda: caches['carts'].delete_many(keys))
+
+
+class BaseCartStorage:
+    """
+    Interface every cart backend implements. Lines are keyed by product id
+    and expose product, product_id, quantity and total_price.
+    """
+
+    def __init__(self, request, user=None):
+        self.request = request
+        self.user = user or request.user
+        # Moves forward on every mutation; keys the memoized totals
+        self.version = 0
+        self._totals = None
+
+    def changed(self):
+        self.version += 1
+
+    def totals(self):
+        """CartTotals for the cart, computed once per cart version"""
+        if self._totals is None or self._totals[0] != self.version:
+            self._totals = (self.version, self.compute_totals())
+        return self._totals[1]
+
+    def compute_totals(self):
+        return quantities_totals(self.quantities())
+
+    def quantities(self):
+        """Map of product id -> quantity, most recently added first"""
+        raise NotImplementedError
+
+    def lines(self):
+        """Cart lines with their products (and categories) loaded"""
+        raise NotImplementedError
+
+    def add(self, product, quantity):
+        """Add quantity of product, capped at stock; returns the new line quantity"""
+        raise NotImplementedError
+
+    def set_quantity(self, product, quantity):
+        """
+        Set a line's quantity, capped at stock; zero or less removes the
+        line. Returns the new quantity, or None if the product is not in
+        the cart.
+        """
+        raise NotImplementedError
+
+    def update_quantities(self, quantities):
+        """
+        Apply several {product id: quantity} changes at once, each capped at
+        stock; zero or less removes the line. Products not in the cart are
+        ignored. Returns {product id: new quantity} for the lines changed.
+        """
+        raise NotImplementedError
+
+    def remove(self, product_id):
+        """Remove a line; returns the number of lines removed"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count(self):
+        """Number of distinct products in the cart"""
+        return len(self.quantities())
+
+    def is_empty(self):
+        return self.count() == 0
+
+    def merge(self, quantities):
+        """Fold another cart's {product id: quantity} into this one"""
+        products = Product.objects.in_bulk(list(quantities))
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is not None and product.stock > 0:
+                self.add(product, quantity)
+
+
+class DatabaseCartStorage(BaseCartStorage):
+    """
+    Cart rows in the products.Cart table (authenticated users only).
+
+    The line count shown in the cart badge is kept as a per-user counter in
+    the 'carts' cache, which every worker shares, and adjusted on every
+    mutation, so rendering the badge issues no SQL once the counter is
+    warm. Lines deleted any other way (cascades, purges) drop the counter
+    on commit through the Cart post_delete receiver. A missing counter is
+    recounted; a short timeout bounds any drift from increments racing
+    across workers.
+    """
+    count_timeout = 60 * 10
+
+    def _rows(self):
+        return Cart.objects.filter(user=self.user)
+
+    def _count_key(self):
+        return cart_count_key(self.user.pk)
+
+    def _adjust_count(self, delta):
+        try:
+            caches['carts'].incr(self._count_key(), delta)
+        except ValueError:
+            pass  # Not cached; the next read recounts
+
+    def quantities(self):
+        return dict(self._rows().values_list('product_id', 'quantity'))
+
+    def compute_totals(self):
+        return database_cart_totals(self._rows())
+
+    def lines(self):
+        return list(self._rows().select_related('product', 'product__category'))
+
+    def add(self, product, quantity):
+        new_quantity, created = add_cart_line(self.user.pk, product.pk, quantity)
+        self.changed()
+        if created:
+            self._adjust_count(1)
+        return new_quantity
+
+    def set_quantity(self, product, quantity):
+        if quantity <= 0:
+            return 0 if self.remove(product.pk) else None
+        new_quantity = set_cart_line_quantity(self.user.pk, product.pk, quantity)
+        if new_quantity is None:
+            return None
+        self.changed()
+        if new_quantity == 0:
+            self._adjust_count(-1)  # Out of stock; the line was deleted
+        return new_quantity
+
+    def update_quantities(self, quantities):
+        # One query reads the affected lines together with their stock
+        lines = self._rows().filter(product_id__in=quantities).select_related('product')
+        updated = {}
+        changed = []
+        removed = []
+        for line in lines:
+            quantity = min(quantities[line.product_id], line.product.stock)
+            if quantity <= 0:
+                removed.append(line.pk)
+                quantity = 0
+            elif quantity != line.quantity:
+                line.quantity = quantity
+                changed.append(line)
+            updated[line.product_id] = quantity
+        self.changed()
+        with transaction.atomic():
+            if changed:
+                Cart.objects.bulk_update(changed, ['quantity'])
+            if removed:
+                deleted, _ = Cart.objects.filter(pk__in=removed).delete()
+                self._adjust_count(-deleted)
+        return updated
+
+    def remove(self, product_id):
+        deleted, _ = self._rows().filter(product_id=product_id).delete()
+        if deleted:
+            self.changed()
+            self._adjust_count(-deleted)
+        return deleted
+
+    def clear(self):
+        self._rows().delete()
+        self.changed()
+        caches['carts'].set(self._count_key(), 0, self.count_timeout)
+
+    def count(self):
+        key = self._count_key()
+        count = caches['carts'].get(key)
+        if count is None:
+            count = self._rows().count()
+            caches['carts'].set(key, count, self.count_timeout)
+        return count
+
+
+class CacheCartStorage(BaseCartStorage):
+    """
+    Cart held as {product id: quantity} in the 'carts' cache, keyed by user
+    or, for anonymous visitors, by a random cart id kept in the session.
+    Nothing is written to the database until checkout or a login merge;
+    reads check the ids against Product and drop lines whose product has
+    since been deleted.
+    """
+    session_key = 'cart_id'
+
+    def _cache(self):
+        return caches['carts']
+
+    def _key(self, create=False):
+        if self.user.is_authenticated:
+            return f'cart:user:{self.user.pk}'
+        cart_id = self.request.session.get(self.session_key)
+        if cart_id is None:
+            if not create:
+                return None
+            cart_id = uuid.uuid4().hex
+            self.request.session[self.session_key] = cart_id
+        return f'cart:anon:{cart_id}'
+
+    def _stored(self):
+        key = self._key()
+        if key is None:
+            return {}
+        return self._cache().get(key, {})
+
+    def _prune(self, quantities, live_ids):
+        """Drop lines whose product has been deleted, saving the cart if any were"""
+        pruned = {pk: quantity for pk, quantity in quantities.items() if pk in live_ids}
+        if len(pruned) != len(quantities):
+            self._save(pruned)
+        return pruned
+
+    def quantities(self):
+        quantities = self._stored()
+        if not quantities:
+            return quantities
+        live_ids = set(
+            Product.objects.filter(pk__in=list(quantities)).values_list('pk', flat=True)
+        )
+        return self._prune(quantities, live_ids)
+
+    def _save(self, quantities):
+        self.changed()
+        key = self._key(create=True)
+        if quantities:
+            self._cache().set(key, quantities)
+        else:
+            self._cache().delete(key)
+
+    def lines(self):
+        quantities = self._stored()
+        if not quantities:
+            return []
+        products = Product.objects.select_related('category').in_bulk(list(quantities))
+        quantities = self._prune(quantities, products)
+        return [
+            CartLine(products[product_id], quantity)
+            for product_id, quantity in quantities.items()
+        ]
+
+    def add(self, product, quantity):
+        quantities = self.quantities()
+        if product.pk in quantities:
+            # An existing line keeps its place, as it keeps its added_at in the table
+            new_quantity = min(quantities[product.pk] + quantity, product.stock)
+            quantities[product.pk] = new_quantity
+            self._save(quantities)
+            return new_quantity
+        new_quantity = min(quantity, product.stock)
+        if new_quantity <= 0:
+            return 0
+        # Most recently added first, like the Cart table ordering
+        self._save({product.pk: new_quantity, **quantities})
+        return new_quantity
+
+    def set_quantity(self, product, quantity):
+        quantities = self.quantities()
+        if product.pk not in quantities:
+            return None
+        if quantity <= 0:
+            del quantities[product.pk]
+            quantity = 0
+        else:
+            quantity = quantities[product.pk] = min(quantity, product.stock)
+        self._save(quantities)
+        return quantity
+
+    def update_quantities(self, quantities):
+        current = self.quantities()
+        stock = dict(
+            Product.objects.filter(pk__in=[pk for pk in quantities if pk in current])
+            .values_list('pk', 'stock')
+        )
+        updated = {}
+        for product_id, stock_left in stock.items():
+            quantity = min(quantities[product_id], stock_left)
+            if quantity <= 0:
+                del current[product_id]
+                quantity = 0
+            else:
+                current[product_id] = quantity
+            updated[product_id] = quantity
+        if updated:
+            self._save(current)
+        return updated
+
+    def remove(self, product_id):
+        quantities = self._stored()
+        if quantities.pop(product_id, None) is None:
+            return 0
+        self._save(quantities)
+        return 1
+
+    def clear(self):
+        key = self._key()
+        if key is not None:
+            self._cache().delete(key)
+            self.changed()
+
+
+def get_cart_storage_class(user):
+    if user.is_authenticated:
+        return import_string(settings.CART_STORAGE)
+    return CacheCartStorage
+
+
+def get_cart(request):
+    """
+    Cart storage for this request: the configured CART_STORAGE backend for
+    signed-in users, the cache-backed cart for anonymous visitors.
+    """
+    if not hasattr(request, '_cart'):
+        request._cart = get_cart_storage_class(request.user)(request)
+    return request._cart
+
+
+def merge_anonymous_cart(request, user):
+    """Move an anonymous visitor's cart into their account after login"""
+    cart_id = request.session.get(CacheCartStorage.session_key)
+    if cart_id is None:
+        return
+    key = f'cart:anon:{cart_id}'
+    quantities = caches['carts'].get(key)
+    if quantities:
+        get_cart_storage_class(user)(request, user=user).merge(quantities)
+    if hasattr(request, '_cart'):
+        del request._cart
+    caches['carts'].delete(key)
+    del request.session[CacheCartStorage.session_key]
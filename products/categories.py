@@ -0,0 +1,72 @@
+"""
+Process-local registry of catalog categories
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+
+from .cache import CATEGORY_VERSION_KEY, bump_counter, get_counter
+from .models import Category
+
+
+class CategoryRegistry:
+    """
+    Holds the full category list and a slug -> category map per worker.
+
+    Each access compares the locally loaded version with the shared
+    category version counter (a read of its cache mirror, no SQL) and
+    reloads after a Category has been saved or deleted somewhere. A copy
+    is also never kept longer than CATEGORY_REGISTRY_TTL seconds, which
+    bounds how long a worker can miss a bump.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = 0.0
+        self._categories = []
+        self._by_slug = {}
+
+    def _stale(self, version):
+        return version != self._version or time.monotonic() >= self._expires
+
+    def _current(self):
+        version = get_counter(CATEGORY_VERSION_KEY)
+        if self._stale(version):
+            with self._lock:
+                if self._stale(version):
+                    categories = list(Category.objects.all())
+                    self._by_slug = {category.slug: category for category in categories}
+                    self._categories = categories
+                    self._version = version
+                    self._expires = time.monotonic() + settings.CATEGORY_REGISTRY_TTL
+        return self._categories, self._by_slug
+
+    def all(self):
+        """All categories in display order"""
+        return self._current()[0]
+
+    def get(self, slug):
+        """Category for slug, or None"""
+        return self._current()[1].get(slug)
+
+    def get_or_404(self, slug):
+        """Category for slug, raising Http404 like get_object_or_404"""
+        category = self.get(slug)
+        if category is None:
+            raise Http404('No Category matches the given query.')
+        return category
+
+    def invalidate(self):
+        """
+        Force every worker to reload on its next access. The bump waits for
+        the current transaction to commit, so nobody reloads the old rows
+        and keeps them under the new version.
+        """
+        transaction.on_commit(lambda: bump_counter(CATEGORY_VERSION_KEY))
+
+
+category_registry = CategoryRegistry()
@@ -0,0 +1,84 @@
+"""
+Conditional GET (ETag / Last-Modified) support for catalog pages
+"""
+import hashlib
+from functools import wraps
+
+from django.contrib import messages
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .cache import catalog_modified, get_catalog_version
+from .carts import CacheCartStorage
+from .models import Product
+
+
+PUBLIC_MAX_AGE = 60
+
+
+def catalog_condition(etag_func=None, last_modified_func=None, max_age=PUBLIC_MAX_AGE):
+    """
+    Answer If-None-Match / If-Modified-Since with 304 before the view runs
+    and mark the page publicly cacheable unless it embeds a CSRF token.
+    Only applies to anonymous visitors without a cart or pending flash
+    messages; everyone else sees per-user content (cart badge, username)
+    and gets a private response.
+    """
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag_func, last_modified_func=last_modified_func
+        )(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if (request.user.is_authenticated
+                    or CacheCartStorage.session_key in request.session
+                    or len(messages.get_messages(request))):
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+            response = conditional_view(request, *args, **kwargs)
+            if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+                # The page embeds a per-visitor CSRF token (e.g. add to cart)
+                patch_cache_control(response, private=True, max_age=max_age)
+            else:
+                patch_cache_control(response, public=True, max_age=max_age)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return inner
+    return decorator
+
+
+def listing_etag(request, *args, **kwargs):
+    """Listings change only when the catalog version moves"""
+    signature = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'{get_catalog_version()}-{signature}'
+
+
+def _product_updated_at(request, slug):
+    """Product.updated_at, fetched once per request with a narrow slug lookup"""
+    if not hasattr(request, '_product_updated_at'):
+        request._product_updated_at = (
+            Product.objects.filter(slug=slug).values_list('updated_at', flat=True).first()
+        )
+    return request._product_updated_at
+
+
+def product_last_modified(request, slug):
+    """
+    The later of Product.updated_at and the last catalog change: stock
+    moves (checkout, holds) and related cards are bulk updates that leave
+    updated_at alone but always bump the catalog version.
+    """
+    updated_at = _product_updated_at(request, slug)
+    if updated_at is None:
+        return None
+    return max(updated_at, catalog_modified())
+
+
+def product_etag(request, slug):
+    """A product page changes with the product itself or its related cards"""
+    updated_at = _product_updated_at(request, slug)
+    if updated_at is None:
+        return None
+    return f'{slug}-{updated_at.timestamp()}-{get_catalog_version()}'
@@ -1,12 +1,11 @@
 """
 Context processors for products app
 """
-from .models import Cart
+from django.utils.functional import SimpleLazyObject
+
+from .carts import get_cart
 
 
 def cart_count(request):
-    """Add cart item count to all templates"""
-    if request.user.is_authenticated:
-        count = Cart.objects.filter(user=request.user).count()
-        return {'cart_count': count}
-    return {'cart_count': 0}
\ No newline at end of file
+    """Add cart item count to all templates, evaluated only if a template reads it"""
+    return {'cart_count': SimpleLazyObject(lambda: get_cart(request).count())}
\ No newline at end of file
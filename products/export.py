@@ -0,0 +1,73 @@
+"""
+Streaming catalog export (CSV / JSON Lines) for feeds and partners
+"""
+import csv
+import json
+
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .models import Product
+
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_COLUMNS = [
+    'id', 'slug', 'name', 'description', 'price', 'stock', 'available',
+    'category', 'category_slug', 'image_url', 'url', 'updated_at',
+]
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_catalog_rows(base_url='', chunk_size=2000):
+    """
+    Yield one dict per product, joining category in the same query and
+    streaming with QuerySet.iterator() (a server-side cursor on Postgres)
+    so memory stays constant regardless of catalog size.
+    """
+    products = Product.objects.order_by('pk').values_list(
+        'id', 'slug', 'name', 'description', 'price', 'stock', 'available',
+        'category__name', 'category__slug', 'image', 'updated_at',
+    )
+    for (pk, slug, name, description, price, stock, available,
+         category, category_slug, image, updated_at) in products.iterator(chunk_size=chunk_size):
+        yield {
+            'id': pk,
+            'slug': slug,
+            'name': name,
+            'description': description,
+            'price': str(price),
+            'stock': stock,
+            'available': available,
+            'category': category,
+            'category_slug': category_slug,
+            'image_url': default_storage.url(image) if image else '',
+            'url': base_url + reverse('products:product_detail', args=[slug]),
+            'updated_at': updated_at.isoformat(),
+        }
+
+
+def iter_catalog_csv(base_url='', chunk_size=2000):
+    """Yield the catalog as CSV lines, header first"""
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_COLUMNS)
+    yield writer.writeheader()
+    for row in iter_catalog_rows(base_url, chunk_size):
+        yield writer.writerow(row)
+
+
+def iter_catalog_jsonl(base_url='', chunk_size=2000):
+    """Yield the catalog as JSON Lines"""
+    for row in iter_catalog_rows(base_url, chunk_size):
+        yield json.dumps(row) + '\n'
+
+
+def iter_catalog(export_format, base_url='', chunk_size=2000):
+    if export_format == 'jsonl':
+        return iter_catalog_jsonl(base_url, chunk_size)
+    return iter_catalog_csv(base_url, chunk_size)
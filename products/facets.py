@@ -0,0 +1,100 @@
+"""
+Faceted navigation counts for catalog listings
+"""
+import hashlib
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from .cache import get_catalog_version
+from .categories import category_registry
+from .models import Product, ProductCard
+from .search import get_search_backend
+
+
+# Price histogram buckets as [low, high) in GBP; None means open-ended
+PRICE_BUCKETS = [(0, 10), (10, 25), (25, 50), (50, 100), (100, 250), (250, None)]
+
+
+def _price_q(min_price=None, max_price=None):
+    q = Q()
+    if min_price:
+        q &= Q(price__gte=min_price)
+    if max_price:
+        q &= Q(price__lte=max_price)
+    return q
+
+
+def _bucket_q(low, high):
+    q = Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def compute_facets(search_query=None, category_id=None, min_price=None, max_price=None):
+    """
+    Compute category counts and the price histogram in one grouped query.
+
+    Rows are grouped by category with conditional counts, so each facet
+    ignores its own filter: category counts honour the price filter but
+    not the category filter, and the histogram honours the category
+    filter but not the price filter. Returns plain ids and counts.
+    """
+    cards = ProductCard.objects.filter(available=True)
+    if search_query:
+        matches = get_search_backend().search(Product.objects.filter(available=True), search_query)
+        cards = cards.filter(id__in=matches.values('id'))
+
+    price_q = _price_q(min_price, max_price)
+    aggregates = {
+        'matching': Count('id', filter=price_q) if price_q else Count('id'),
+    }
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'bucket_{index}'] = Count('id', filter=_bucket_q(low, high))
+    rows = cards.order_by().values('category').annotate(**aggregates)
+
+    category_counts = {}
+    bucket_counts = [0] * len(PRICE_BUCKETS)
+    for row in rows:
+        category_counts[row['category']] = row['matching']
+        if category_id is None or row['category'] == category_id:
+            for index in range(len(PRICE_BUCKETS)):
+                bucket_counts[index] += row[f'bucket_{index}']
+    return {'category_counts': category_counts, 'bucket_counts': bucket_counts}
+
+
+def get_facets(search_query=None, category=None, min_price=None, max_price=None):
+    """
+    Facets for the current filter, cached per catalog version and filter
+    signature. Categories come from the in-memory registry.
+    """
+    category_id = category.pk if category else None
+    signature = hashlib.md5(
+        repr((search_query, category_id, min_price, max_price)).encode()
+    ).hexdigest()
+    key = f'catalog:facets:{get_catalog_version()}:{signature}'
+    fragment_cache = caches['catalog']
+    counts = fragment_cache.get(key)
+    if counts is None:
+        counts = compute_facets(search_query, category_id, min_price, max_price)
+        fragment_cache.set(key, counts)
+
+    category_counts = counts['category_counts']
+    price_buckets = []
+    for (low, high), count in zip(PRICE_BUCKETS, counts['bucket_counts']):
+        price_buckets.append({
+            'label': f'£{low}+' if high is None else f'£{low} – £{high}',
+            'min': low,
+            # Filters use price__lte, so stop a penny short of the next bucket
+            'max': None if high is None else Decimal(high) - Decimal('0.01'),
+            'count': count,
+        })
+    return {
+        'categories': [
+            {'category': cat, 'count': category_counts.get(cat.pk, 0)}
+            for cat in category_registry.all()
+        ],
+        'price_buckets': price_buckets,
+    }
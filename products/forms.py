@@ -61,14 +61,9 @@ class ProductForm(forms.ModelForm):
         name = self.cleaned_data.get('name')
         
         if not slug and name:
-            from django.utils.text import slugify
-            slug = slugify(name)
+            from .slugs import allocate_slugs, base_slug
             
             # Ensure uniqueness
-            original_slug = slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exclude(pk=self.instance.pk).exists():
-                slug = f"{original_slug}-{counter}"
-                counter += 1
+            slug = allocate_slugs([base_slug(name)], exclude_pk=self.instance.pk)[0]
         
         return slug
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Bulk product import pipeline (CSV / JSON Lines)
+"""
+import csv
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .cache import bump_catalog_version
+from .cards import rebuild_product_cards
+from .categories import category_registry
+from .models import Category, Product
+from .search import get_search_backend
+from .slugs import allocate_slugs, base_slug
+
+
+UPDATE_FIELDS = ['name', 'category', 'description', 'price', 'stock', 'available', 'updated_at']
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+# Tries at writing a batch whose slugs a concurrent import keeps taking
+WRITE_ATTEMPTS = 3
+# Largest stock a PositiveIntegerField holds on every supported database
+MAX_STOCK = 2147483647
+
+
+class RowError(ValueError):
+    """A single input row failed validation"""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    errors: list = field(default_factory=list)  # (line number, message)
+    seconds: float = 0.0
+
+    @property
+    def rows(self):
+        return self.created + self.updated
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def read_rows(stream, input_format):
+    """Yield (line number, dict) pairs from a CSV or JSONL stream"""
+    if input_format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as exc:
+                    yield line_number, exc
+    else:
+        # Line 1 is the header
+        for line_number, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_number, row
+
+
+def clean_row(row):
+    """Validate and coerce one raw row; category stays unresolved"""
+    if isinstance(row, Exception):
+        raise RowError(f'Invalid JSON: {row}')
+
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise RowError('name is required')
+    description = str(row.get('description') or '').strip()
+    if not description:
+        raise RowError('description is required')
+    category = str(row.get('category') or '').strip()
+    if not category:
+        raise RowError('category is required')
+
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError):
+        raise RowError(f"invalid price {row.get('price')!r}")
+    if not price.is_finite():
+        raise RowError(f"invalid price {row.get('price')!r}")
+    if price < 0 or price >= Decimal('100000000'):
+        raise RowError(f'price out of range: {price}')
+
+    try:
+        stock = int(row.get('stock') or 0)
+    except (TypeError, ValueError):
+        raise RowError(f"invalid stock {row.get('stock')!r}")
+    if stock < 0:
+        raise RowError('stock cannot be negative')
+    if stock > MAX_STOCK:
+        raise RowError(f'stock out of range: {stock}')
+
+    available = row.get('available', True)
+    if isinstance(available, str):
+        available = available.strip().lower() in TRUE_VALUES if available.strip() else True
+
+    slug = slugify(str(row.get('slug') or '').strip())
+    return {
+        'name': name[:200],
+        'slug': slug,
+        'category': category,
+        'description': description,
+        'price': price,
+        'stock': stock,
+        'available': bool(available),
+    }
+
+
+def resolve_categories(keys, create_missing=False):
+    """Map category names/slugs to Category objects with one query per batch"""
+    keys = set(keys)
+    categories = {}
+    for category in Category.objects.filter(Q(slug__in=keys) | Q(name__in=keys)):
+        categories[category.slug] = category
+        categories[category.name] = category
+    missing = keys - set(categories)
+    if missing and create_missing:
+        new = [Category(name=key, slug=slugify(key)) for key in sorted(missing)]
+        Category.objects.bulk_create(new, ignore_conflicts=True)
+        category_registry.invalidate()
+        for category in Category.objects.filter(name__in=missing):
+            categories[category.name] = category
+    return categories
+
+
+def import_batch(rows, result, create_categories=False, user=None):
+    """
+    Write one batch of (line number, cleaned row) pairs in a transaction.
+
+    Rows whose explicit slug already exists update that product; everything
+    else is inserted, with slugs made unique set-wise for the batch. If a
+    concurrent import takes one of the allocated slugs first, the batch is
+    planned and written again; after WRITE_ATTEMPTS its rows are reported
+    as errors instead.
+    """
+    categories = resolve_categories((row['category'] for _, row in rows), create_categories)
+    valid = []
+    for line_number, row in rows:
+        category = categories.get(row['category'])
+        if category is None:
+            result.errors.append((line_number, f"unknown category {row['category']!r}"))
+            continue
+        row['category'] = category
+        valid.append((line_number, row))
+    if not valid:
+        return []
+
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            new_products, to_update = write_batch([row for _, row in valid], user)
+            break
+        except IntegrityError:
+            if attempt == WRITE_ATTEMPTS - 1:
+                result.errors.extend(
+                    (line_number, 'slug taken by a concurrent import; import the row again')
+                    for line_number, _ in valid
+                )
+                return []
+
+    result.created += len(new_products)
+    result.updated += len(to_update)
+    slugs_written = [product.slug for product in itertools.chain(new_products, to_update)]
+    return list(Product.objects.filter(slug__in=slugs_written).values_list('pk', flat=True))
+
+
+def write_batch(rows, user=None):
+    """
+    Split cleaned rows into updates of existing slugs and inserts, and write
+    both in one transaction. Returns (new products, updated products).
+    """
+    explicit = [row['slug'] for row in rows if row['slug']]
+    existing = Product.objects.in_bulk(explicit, field_name='slug')
+    now = timezone.now()
+
+    to_update = []
+    to_create = []
+    for row in rows:
+        product = existing.get(row['slug'])
+        if product is not None:
+            for name in UPDATE_FIELDS[:-1]:
+                setattr(product, name, row[name])
+            product.updated_at = now
+            to_update.append(product)
+        else:
+            to_create.append(row)
+
+    # Explicit slugs keep their value unless taken; generated ones are deduplicated
+    slugs = allocate_slugs([row['slug'] or base_slug(row['name']) for row in to_create])
+    new_products = [
+        Product(created_by=user, **dict(row, slug=slug))
+        for row, slug in zip(to_create, slugs)
+    ]
+
+    with transaction.atomic():
+        Product.objects.bulk_create(new_products)
+        Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+    return new_products, to_update
+
+
+def import_products(stream, input_format='csv', batch_size=1000,
+                    create_categories=False, user=None, on_batch=None):
+    """
+    Import products from a stream in batches, then refresh the search
+    index, listing cards and catalog cache for the touched products
+    (bulk writes bypass model signals).
+    """
+    result = ImportResult()
+    started = time.monotonic()
+    rows = read_rows(stream, input_format)
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            break
+        cleaned = []
+        for line_number, row in chunk:
+            try:
+                cleaned.append((line_number, clean_row(row)))
+            except RowError as exc:
+                result.errors.append((line_number, str(exc)))
+
+        product_ids = import_batch(cleaned, result, create_categories, user) if cleaned else []
+        if product_ids:
+            get_search_backend().rebuild(product_ids)
+            rebuild_product_cards(batch_size=batch_size, product_ids=product_ids)
+        result.seconds = time.monotonic() - started
+        if on_batch is not None:
+            on_batch(result)
+
+    if result.rows:
+        bump_catalog_version()
+    result.seconds = time.monotonic() - started
+    return result
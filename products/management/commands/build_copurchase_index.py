@@ -0,0 +1,22 @@
+"""
+Rebuild the "frequently bought together" index from order history
+"""
+from django.core.management.base import BaseCommand
+
+from products.recommendations import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild co-purchase counts and product recommendations from all orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Order lines fetched and pairs written per batch (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        pairs, products = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {pairs} co-purchase pairs for {products} products.'
+        ))
@@ -0,0 +1,47 @@
+"""
+Export the product catalog as CSV or JSON Lines
+"""
+from django.core.management.base import BaseCommand
+
+from products.export import EXPORT_FORMATS, iter_catalog
+
+
+class Command(BaseCommand):
+    help = 'Stream the full product catalog to a CSV or JSONL file (or stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument(
+            '--output', '-o', default='-',
+            help='Output file path, or - for stdout (default)',
+        )
+        parser.add_argument(
+            '--base-url', default='',
+            help='Prefix for product URLs, e.g. https://shop.example.com',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Rows fetched per round trip from the database cursor',
+        )
+
+    def handle(self, *args, **options):
+        lines = iter_catalog(
+            options['format'],
+            base_url=options['base_url'].rstrip('/'),
+            chunk_size=options['chunk_size'],
+        )
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        if options['format'] == 'csv':
+            count -= 1  # Header
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {count} products to {options['output']}."
+        ))
@@ -0,0 +1,73 @@
+"""
+Bulk import products from CSV or JSON Lines
+"""
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import import_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Import products in batches from a CSV (with header) or JSONL file. '
+        'Columns: name, slug (optional), category (name or slug), description, '
+        'price, stock, available. Rows whose slug already exists update that product.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file path, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Input format (default: from file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows validated and written per transaction (default: 1000)')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories that do not exist yet')
+        parser.add_argument('--user', help='Username recorded as created_by on new products')
+
+    def handle(self, *args, **options):
+        input_format = options['format']
+        if input_format is None:
+            input_format = 'jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv'
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']!r} does not exist.")
+
+        def report(result):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{result.rows} rows ({result.rows_per_second:,.0f} rows/sec)'
+                )
+
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['path'], newline='', encoding='utf-8')
+            except OSError as exc:
+                raise CommandError(str(exc))
+        try:
+            result = import_products(
+                stream,
+                input_format=input_format,
+                batch_size=options['batch_size'],
+                create_categories=options['create_categories'],
+                user=user,
+                on_batch=report,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for line_number, message in result.errors:
+            self.stderr.write(f'Line {line_number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created}, updated {result.updated}, '
+            f'skipped {len(result.errors)} rows in {result.seconds:.2f}s '
+            f'({result.rows_per_second:,.0f} rows/sec).'
+        ))
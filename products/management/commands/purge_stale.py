@@ -0,0 +1,60 @@
+"""
+Purge abandoned carts, expired stock holds and expired sessions in small batches
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from products.purge import (
+    purge_expired_cached_carts, purge_expired_sessions, purge_stale_carts,
+)
+from products.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete cart lines of users inactive for --cart-days, expired cached carts, '
+        'expired stock holds and expired sessions, '
+        'in short keyset-paginated transactions with a pause between batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cart-days', type=int, default=30,
+                            help='Delete carts with nothing added for this many days (default: 30)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per transaction (default: 1000)')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Seconds to sleep between batches (default: 0.1)')
+        parser.add_argument('--skip-carts', action='store_true', help='Leave carts alone')
+        parser.add_argument('--skip-holds', action='store_true', help='Leave stock holds alone')
+        parser.add_argument('--skip-sessions', action='store_true', help='Leave sessions alone')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['cart_days'] < 1:
+            raise CommandError('--cart-days must be at least 1.')
+
+        def report(label):
+            def on_batch(result):
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f'{label}: {result.deleted} rows ({result.rows_per_second:,.0f} rows/sec)'
+                    )
+            return on_batch
+
+        batching = {'batch_size': options['batch_size'], 'pause': options['pause']}
+        if not options['skip_carts']:
+            result = purge_stale_carts(options['cart_days'], on_batch=report('Carts'), **batching)
+            self.write_result('Carts', result)
+            self.write_result('Cached carts', purge_expired_cached_carts())
+        if not options['skip_holds']:
+            result = release_expired_holds(on_batch=report('Holds'), **batching)
+            self.write_result('Holds', result)
+        if not options['skip_sessions']:
+            result = purge_expired_sessions(on_batch=report('Sessions'), **batching)
+            self.write_result('Sessions', result)
+
+    def write_result(self, label, result):
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: deleted {result.deleted} rows in {result.batches} batches, '
+            f'{result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/sec).'
+        ))
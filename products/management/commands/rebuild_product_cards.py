@@ -0,0 +1,20 @@
+"""
+Rebuild the ProductCard listing read model
+"""
+from django.core.management.base import BaseCommand
+
+from products.cards import rebuild_product_cards
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized product cards used by listing pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Products upserted per statement (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_product_cards(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} product cards.'))
@@ -0,0 +1,23 @@
+"""
+Rebuild the product full-text search index
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from products.search import InProcessSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Re-index every product in the configured search backend'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if isinstance(backend, InProcessSearchBackend):
+            # Its index lives in each server process's memory, not in this one
+            raise CommandError(
+                'The in-process search backend keeps a per-process index that '
+                'every server builds on its first search; there is nothing to rebuild.'
+            )
+        count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} products with {type(backend).__name__}.'
+        ))
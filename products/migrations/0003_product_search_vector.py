@@ -0,0 +1,45 @@
+# Generated by Django 4.2.11 on 2026-10-17 09:12
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """Backfill search vectors and add the GIN index (Postgres only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f"UPDATE products_product SET search_vector = {SEARCH_DOCUMENT}"
+    )
+    schema_editor.execute(
+        "CREATE INDEX products_product_search_vector_gin "
+        "ON products_product USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS products_product_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
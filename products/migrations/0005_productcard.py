@@ -0,0 +1,64 @@
+# Generated by Django 4.2.11 on 2026-10-17 16:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.text import Truncator
+
+
+def backfill_product_cards(apps, schema_editor):
+    """Project existing products onto listing cards in batches"""
+    Product = apps.get_model('products', 'Product')
+    ProductCard = apps.get_model('products', 'ProductCard')
+    batch = []
+    for product in Product.objects.select_related('category').order_by('pk').iterator(chunk_size=1000):
+        batch.append(ProductCard(
+            id=product.pk,
+            slug=product.slug,
+            name=product.name,
+            summary=Truncator(product.description).chars(300),
+            price=product.price,
+            category=product.category,
+            category_name=product.category.name,
+            category_slug=product.category.slug,
+            image_url=product.image.url if product.image else '',
+            stock=product.stock,
+            available=product.available,
+            created_at=product.created_at,
+        ))
+        if len(batch) >= 1000:
+            ProductCard.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        ProductCard.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('slug', models.SlugField(max_length=200)),
+                ('name', models.CharField(max_length=200)),
+                ('summary', models.CharField(blank=True, max_length=300)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category_name', models.CharField(max_length=200)),
+                ('category_slug', models.SlugField(max_length=200)),
+                ('image_url', models.CharField(blank=True, max_length=500)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('available', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cards', to='products.category')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['available', '-created_at', '-id'], name='products_pr_availab_1f8428_idx'), models.Index(fields=['available', 'price', 'id'], name='products_pr_availab_9d409c_idx'), models.Index(fields=['available', 'name', 'id'], name='products_pr_availab_3b32ce_idx'), models.Index(fields=['category', 'available', '-created_at', '-id'], name='products_pr_categor_372b8c_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_product_cards, migrations.RunPython.noop),
+    ]
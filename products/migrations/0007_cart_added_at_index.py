@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-17 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_copurchase_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['added_at'], name='products_ca_added_a_8d487c_idx'),
+        ),
+    ]
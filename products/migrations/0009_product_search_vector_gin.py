@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-17 20:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+def drop_raw_search_index(apps, schema_editor):
+    """Drop the GIN index 0003 created with raw SQL; AddIndex below replaces it"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS products_product_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_stockhold'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_raw_search_index, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ),
+    ]
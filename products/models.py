@@ -1,8 +1,13 @@
 """
 Product models for ShopClub
 """
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
 
 class Category(models.Model):
@@ -41,11 +46,20 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='products')
     
+    # Full-text search document, GIN-indexed on Postgres (see products.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['slug']),
             models.Index(fields=['-created_at']),
+            # Keyset pagination sort keys (see products.pagination)
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['price', 'id']),
+            models.Index(fields=['name', 'id']),
+            # Full-text matches (products.search.PostgresSearchBackend)
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
         ]
     
     def __str__(self):
@@ -60,6 +74,77 @@ class Product(models.Model):
         return self.stock > 0 and self.available
 
 
+class ProductCard(models.Model):
+    """
+    Denormalized read model for product listing cards.
+
+    One narrow row per product, carrying the category name/slug and image
+    URL so a listing page is a single indexed query with no joins and no
+    description TextField. Kept current by the Product/Category signals
+    below (see products.cards); rebuild with `manage.py rebuild_product_cards`.
+    """
+    id = models.BigIntegerField(primary_key=True)  # Mirrors Product.id
+    slug = models.SlugField(max_length=200)
+    name = models.CharField(max_length=200)
+    summary = models.CharField(max_length=300, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='cards')
+    category_name = models.CharField(max_length=200)
+    category_slug = models.SlugField(max_length=200)
+    image_url = models.CharField(max_length=500, blank=True)
+    stock = models.PositiveIntegerField(default=0)  # Available to sell, net of holds
+    available = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['available', '-created_at', '-id']),
+            models.Index(fields=['available', 'price', 'id']),
+            models.Index(fields=['available', 'name', 'id']),
+            models.Index(fields=['category', 'available', '-created_at', '-id']),
+        ]
+    
+    def __str__(self):
+        return self.name
+    
+    def get_absolute_url(self):
+        return reverse('products:product_detail', args=[self.slug])
+    
+    @property
+    def in_stock(self):
+        """Check if product is in stock"""
+        return self.stock > 0 and self.available
+
+
+class CoPurchase(models.Model):
+    """Sparse item-to-item co-occurrence counts mined from orders"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('product', 'other')
+        indexes = [
+            models.Index(fields=['product', '-count', 'other']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id} x {self.count}"
+
+
+class ProductRecommendation(models.Model):
+    """Precomputed "frequently bought together" neighbours for a product"""
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='recommendation'
+    )
+    neighbour_ids = models.JSONField(default=list)  # Best first
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recommendations for {self.product_id}"
+
+
 class Cart(models.Model):
     """Shopping cart for users"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart')
@@ -70,6 +155,10 @@ class Cart(models.Model):
     class Meta:
         unique_together = ('user', 'product')
         ordering = ['-added_at']
+        indexes = [
+            # Finding abandoned carts (purge_stale)
+            models.Index(fields=['added_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.product.name} x {self.quantity}"
@@ -78,3 +167,113 @@ class Cart(models.Model):
     def total_price(self):
         """Calculate total price for this cart item"""
         return self.product.price * self.quantity
+
+
+class StockHold(models.Model):
+    """
+    Stock set aside for a shopper between payment intent and order commit.
+    Active holds count against available-to-sell until they are converted
+    by checkout, replaced, or released by the sweeper after expires_at
+    (see products.reservations).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'product')
+        indexes = [
+            # Summing active holds per product
+            models.Index(fields=['product', 'expires_at']),
+            # Finding expired holds (purge_stale)
+            models.Index(fields=['expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} holds {self.product_id} x {self.quantity}"
+
+
+class VersionCounter(models.Model):
+    """
+    A shared version counter (catalog, categories) that cached copies are
+    keyed by. Bumps are a single UPDATE ... SET value = value + 1, so
+    concurrent bumps can never land on the same version; the cache only
+    holds a mirror of the latest value (see products.cache).
+    """
+    key = models.CharField(max_length=100, primary_key=True)
+    value = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """Keep the search index and listing card in sync when a product is saved"""
+    if raw:
+        return
+    from .search import get_search_backend
+    from .cards import sync_product_card
+    get_search_backend().index(instance)
+    sync_product_card(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop a deleted product from the search index and listing cards"""
+    from .search import get_search_backend
+    get_search_backend().remove(instance.pk)
+    ProductCard.objects.filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_cards(sender, instance, created, raw=False, **kwargs):
+    """Copy a renamed category onto its products' listing cards"""
+    if raw or created:
+        return
+    from .cards import sync_category_cards
+    sync_category_cards(instance)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def bump_catalog(sender, raw=False, **kwargs):
+    """
+    Invalidate cached catalog fragments whenever the catalog changes. The
+    version moves on commit, so no concurrent render can cache the old
+    rows under the new version.
+    """
+    if raw:
+        return
+    from .cache import bump_catalog_version
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_registry(sender, raw=False, **kwargs):
+    """Make every worker reload its in-memory category registry once this commits"""
+    if raw:
+        return
+    from .categories import category_registry
+    category_registry.invalidate()
+
+
+@receiver(post_delete, sender=Cart)
+def forget_cart_count(sender, instance, **kwargs):
+    """
+    Drop the owner's cached cart badge counter once a line deletion commits.
+    Cascades (a deleted Product or Category) and purges remove lines
+    without going through the cart storage that keeps the counter.
+    """
+    from .carts import forget_cart_counts
+    forget_cart_counts([instance.user_id])
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carry an anonymous visitor's cart over into their account"""
+    if request is None:
+        return
+    from .carts import merge_anonymous_cart
+    merge_anonymous_cart(request, user)
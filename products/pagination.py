@@ -0,0 +1,186 @@
+"""
+Keyset (cursor) pagination for catalog listings
+"""
+import json
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+# Sort option -> keyset ordering, always ending in a unique id tiebreak
+SORT_KEYS = {
+    '-created_at': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+}
+
+PER_PAGE = 12
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing"""
+    is_cursor_page = True
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_querystring = ''
+        self.previous_querystring = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last row seen instead of using
+    OFFSET, so every page costs the same index range scan and no COUNT(*)
+    is issued. Cursors are opaque tokens encoding the sort key of the
+    boundary row and the direction of travel.
+    """
+
+    def __init__(self, queryset, ordering, per_page=PER_PAGE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    def encode_cursor(self, direction, obj):
+        values = []
+        for name, _ in self.fields:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        payload = json.dumps([direction, values], separators=(',', ':'))
+        return urlsafe_base64_encode(payload.encode())
+
+    def decode_cursor(self, cursor):
+        try:
+            direction, raw_values = json.loads(urlsafe_base64_decode(cursor))
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            model = self.queryset.model
+            values = [
+                model._meta.get_field(name).to_python(raw)
+                for (name, _), raw in zip(self.fields, raw_values)
+            ]
+        except InvalidCursor:
+            raise
+        except Exception as exc:
+            raise InvalidCursor(cursor) from exc
+        return direction, values
+
+    def _seek(self, values, backwards):
+        """Build the row-value comparison that skips past the boundary row"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_page(self, cursor=None):
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = self.decode_cursor(cursor)
+            except InvalidCursor:
+                direction, values = 'next', None
+
+        backwards = direction == 'prev'
+        if backwards:
+            ordering = [
+                name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+            ]
+        else:
+            ordering = self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, backwards))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = self.encode_cursor('next', rows[-1]) if rows and has_next else None
+        previous_cursor = self.encode_cursor('prev', rows[0]) if rows and has_previous else None
+        return KeysetPage(rows, has_next, has_previous, next_cursor, previous_cursor)
+
+
+def _querystring(request, cursor=None, page=None):
+    """The request's query string pointing at another cursor or page number"""
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    if cursor:
+        params['cursor'] = cursor
+    if page is not None:
+        params['page'] = page
+    return params.urlencode()
+
+
+def paginate_numbered(request, object_list, per_page=PER_PAGE):
+    """
+    Numbered pages, with each link's query string keeping the request's
+    other parameters (search, category, sort) intact.
+    """
+    page = Paginator(object_list, per_page).get_page(request.GET.get('page'))
+    if page.has_previous():
+        page.previous_querystring = _querystring(request, page=page.previous_page_number())
+    if page.has_next():
+        page.next_querystring = _querystring(request, page=page.next_page_number())
+    page.page_links = [
+        (number, _querystring(request, page=number)) for number in page.paginator.page_range
+    ]
+    return page
+
+
+def paginate_catalog(request, queryset, sort_by, per_page=PER_PAGE):
+    """
+    Paginate a catalog listing with cursors when the active sort supports
+    it, otherwise fall back to numbered pages (e.g. relevance ordering).
+    """
+    if settings.CATALOG_PAGINATION == 'keyset' and sort_by in SORT_KEYS:
+        paginator = KeysetPaginator(queryset, SORT_KEYS[sort_by], per_page)
+        page = paginator.get_page(request.GET.get('cursor'))
+        if page.next_cursor:
+            page.next_querystring = _querystring(request, page.next_cursor)
+        if page.has_previous():
+            page.previous_querystring = _querystring(request, page.previous_cursor)
+        return page
+
+    return paginate_numbered(request, queryset, per_page)
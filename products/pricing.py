@@ -0,0 +1,62 @@
+"""
+Cart pricing for products app
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Product
+
+
+MONEY_FIELD = DecimalField(max_digits=12, decimal_places=2)
+CENTS = Decimal('0.01')
+
+
+@dataclass(frozen=True)
+class CartTotals:
+    subtotal: Decimal
+    line_count: int
+    item_count: int
+
+    @property
+    def total(self):
+        return self.subtotal  # No tax or shipping
+
+    @property
+    def total_in_cents(self):
+        """Amount in the smallest currency unit, as Stripe expects"""
+        return int(self.total * 100)
+
+    @property
+    def is_empty(self):
+        return self.line_count == 0
+
+
+def database_cart_totals(rows):
+    """Totals for a queryset of Cart rows in one aggregate query"""
+    totals = rows.aggregate(
+        subtotal=Coalesce(Sum(F('quantity') * F('product__price'), output_field=MONEY_FIELD),
+                          Value(Decimal('0')), output_field=MONEY_FIELD),
+        line_count=Count('pk'),
+        item_count=Coalesce(Sum('quantity'), 0),
+    )
+    # Not every backend returns the aggregate at the field's scale
+    totals['subtotal'] = Decimal(totals['subtotal']).quantize(CENTS)
+    return CartTotals(**totals)
+
+
+def quantities_totals(quantities):
+    """Totals for a {product id: quantity} cart, reading only product prices"""
+    if not quantities:
+        return CartTotals(Decimal('0.00'), 0, 0)
+    prices = Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'price')
+    subtotal = Decimal('0.00')
+    line_count = item_count = 0
+    for product_id, price in prices:
+        quantity = quantities[product_id]
+        subtotal += price * quantity
+        line_count += 1
+        item_count += quantity
+    return CartTotals(subtotal, line_count, item_count)
@@ -0,0 +1,97 @@
+"""
+Batched purging of abandoned carts and expired sessions
+"""
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .carts import forget_cart_counts
+from .models import Cart
+
+
+@dataclass
+class PurgeResult:
+    deleted: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.deleted / self.seconds if self.seconds else 0.0
+
+
+def purge_in_batches(queryset, batch_size=1000, pause=0.1, before_delete=None, on_batch=None):
+    """
+    Delete the rows of queryset in primary key order, batch_size at a time.
+
+    Each batch is found with a keyset query (pk > last pk seen) and deleted
+    in its own short transaction, re-applying the queryset's filter so rows
+    that stopped matching in the meantime survive. Sleeping pause seconds
+    between batches leaves room for regular traffic.
+    """
+    result = PurgeResult()
+    started = time.monotonic()
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        last_pk = pks[-1]
+        with transaction.atomic():
+            if before_delete is not None:
+                before_delete(pks)
+            deleted, _ = queryset.filter(pk__in=pks).delete()
+        result.deleted += deleted
+        result.batches += 1
+        result.seconds = time.monotonic() - started
+        if on_batch is not None:
+            on_batch(result)
+        if len(pks) < batch_size:
+            break
+        time.sleep(pause)
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def stale_carts(days):
+    """Cart lines of users who have not added anything in the past `days` days"""
+    cutoff = timezone.now() - timedelta(days=days)
+    active_users = Cart.objects.filter(added_at__gte=cutoff).values('user_id')
+    return Cart.objects.filter(added_at__lt=cutoff).exclude(user_id__in=active_users)
+
+
+def forget_purged_cart_counts(pks):
+    """Drop the cached badge counters of the carts about to be deleted, on commit"""
+    forget_cart_counts(Cart.objects.filter(pk__in=pks).values_list('user_id', flat=True))
+
+
+def purge_stale_carts(days=30, **kwargs):
+    return purge_in_batches(stale_carts(days), before_delete=forget_purged_cart_counts, **kwargs)
+
+
+def purge_expired_cached_carts():
+    """
+    Sweep expired carts out of the 'carts' cache, which never culls (see
+    products.cache_backends.CartFileCache). Backends without a sweep
+    expire entries themselves and are left alone.
+    """
+    result = PurgeResult()
+    started = time.monotonic()
+    delete_expired = getattr(caches['carts'], 'delete_expired', None)
+    if delete_expired is not None:
+        result.deleted = delete_expired()
+        result.batches = 1
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def purge_expired_sessions(**kwargs):
+    return purge_in_batches(Session.objects.filter(expire_date__lt=timezone.now()), **kwargs)
@@ -0,0 +1,156 @@
+"""
+"Frequently bought together" co-purchase index
+"""
+import heapq
+import itertools
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .cards import cards_in_order
+from .models import CoPurchase, Product, ProductCard, ProductRecommendation
+
+
+TOP_N = 12
+RELATED_LIMIT = 4
+# Very large baskets (bulk/trade orders) add noise and quadratic pairs
+MAX_BASKET_SIZE = 50
+
+
+def _pairs(product_ids):
+    """Ordered (product, other) pairs for one basket"""
+    unique = sorted(set(product_ids))
+    if len(unique) > MAX_BASKET_SIZE:
+        return []
+    return list(itertools.permutations(unique, 2))
+
+
+def _store_recommendations(neighbours):
+    ProductRecommendation.objects.bulk_create(
+        [
+            ProductRecommendation(product_id=product_id, neighbour_ids=ids)
+            for product_id, ids in neighbours.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['neighbour_ids', 'updated_at'],
+    )
+
+
+def refresh_recommendations(product_ids):
+    """
+    Recompute the stored top-N neighbour lists for the given products with
+    one windowed query over their pairs and one upsert, however many
+    products the order had.
+    """
+    neighbours = {product_id: [] for product_id in set(product_ids)}
+    rows = (
+        CoPurchase.objects.filter(product_id__in=list(neighbours))
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=F('product_id'),
+            order_by=[F('count').desc(), F('other_id').asc()],
+        ))
+        .filter(rank__lte=TOP_N)
+        .order_by('product_id', 'rank')
+        .values_list('product_id', 'other_id')
+    )
+    for product_id, other_id in rows:
+        neighbours[product_id].append(other_id)
+    _store_recommendations(neighbours)
+
+
+def record_order(product_ids):
+    """
+    Fold one placed order into the index. Missing pairs are inserted at
+    zero and then every pair is incremented in SQL, so concurrent orders
+    never lose counts.
+    """
+    pairs = _pairs(product_ids)
+    if not pairs:
+        return
+    ids = sorted(set(product_ids))
+    with transaction.atomic():
+        CoPurchase.objects.bulk_create(
+            [CoPurchase(product_id=a, other_id=b, count=0) for a, b in pairs],
+            ignore_conflicts=True,
+        )
+        CoPurchase.objects.filter(
+            product_id__in=ids, other_id__in=ids
+        ).update(count=F('count') + 1)
+    refresh_recommendations(ids)
+
+
+def rebuild_index(batch_size=5000):
+    """
+    Rebuild the whole index offline from order history.
+
+    Order lines are streamed in order_id order and folded basket by basket
+    into a sparse pair counter, so memory grows with distinct pairs rather
+    than with the number of orders. Archived orders no longer have item
+    rows; their baskets come from the stored line snapshots, skipping
+    products that have since been deleted.
+    """
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    ArchivedOrder = apps.get_model('orders', 'ArchivedOrder')
+    rows = (
+        OrderItem.objects.filter(product__isnull=False)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=batch_size)
+    )
+    pair_counts = Counter()
+    for _, basket in itertools.groupby(rows, key=lambda row: row[0]):
+        pair_counts.update(_pairs(product_id for _, product_id in basket))
+
+    live = set(Product.objects.values_list('pk', flat=True))
+    snapshots = (
+        ArchivedOrder.objects.order_by('pk')
+        .values_list('line_snapshot', flat=True)
+        .iterator(chunk_size=batch_size)
+    )
+    for lines in snapshots:
+        basket = [line['product_id'] for line in lines if line['product_id'] in live]
+        pair_counts.update(_pairs(basket))
+
+    by_product = defaultdict(list)
+    for (product_id, other_id), count in pair_counts.items():
+        by_product[product_id].append((-count, other_id))
+    neighbours = {
+        product_id: [other_id for _, other_id in heapq.nsmallest(TOP_N, candidates)]
+        for product_id, candidates in by_product.items()
+    }
+
+    with transaction.atomic():
+        CoPurchase.objects.all().delete()
+        ProductRecommendation.objects.all().delete()
+        pairs = [
+            CoPurchase(product_id=product_id, other_id=other_id, count=count)
+            for (product_id, other_id), count in pair_counts.items()
+        ]
+        CoPurchase.objects.bulk_create(pairs, batch_size=batch_size)
+        _store_recommendations(neighbours)
+    return len(pair_counts), len(neighbours)
+
+
+def related_products(product, limit=RELATED_LIMIT):
+    """
+    Cards for products most often bought with product, read with a single
+    primary-key lookup; falls back to the same category without history.
+    """
+    neighbour_ids = (
+        ProductRecommendation.objects.filter(pk=product.pk)
+        .values_list('neighbour_ids', flat=True)
+        .first()
+    )
+    if neighbour_ids:
+        cards = [card for card in cards_in_order(neighbour_ids) if card.available]
+        if cards:
+            return cards[:limit]
+    return list(
+        ProductCard.objects.filter(category_id=product.category_id, available=True)
+        .exclude(id=product.id)[:limit]
+    )
@@ -0,0 +1,102 @@
+"""
+Stock holds taken while a shopper is paying
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .cards import refresh_card_stock
+from .models import Product, StockHold
+from .purge import purge_in_batches
+
+
+def active_holds():
+    return StockHold.objects.filter(expires_at__gt=timezone.now())
+
+
+def held_quantities(product_ids, exclude_user=None):
+    """{product id: quantity held} over active holds, in one grouped query"""
+    holds = active_holds().filter(product_id__in=list(product_ids))
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    return dict(holds.values_list('product_id').annotate(total=Sum('quantity')))
+
+
+def available_to_sell(products, exclude_user=None):
+    """{product id: stock less other shoppers' active holds} for loaded products"""
+    held = held_quantities([product.pk for product in products], exclude_user)
+    return {product.pk: max(product.stock - held.get(product.pk, 0), 0) for product in products}
+
+
+def _changed(product_ids):
+    refresh_card_stock(product_ids)
+    transaction.on_commit(bump_catalog_version)
+
+
+def hold_stock(user, quantities, ttl=None):
+    """
+    Replace user's holds with {product id: quantity} for ttl seconds
+    (STOCK_HOLD_TTL by default).
+
+    The products are locked in id order while other shoppers' holds are
+    counted, so two shoppers cannot both hold the last units. Returns
+    {product: quantity available} for lines that cannot be held; in that
+    case nothing is held.
+    """
+    ttl = settings.STOCK_HOLD_TTL if ttl is None else ttl
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=list(quantities))
+            .order_by('pk')
+        )
+        available = available_to_sell(products, exclude_user=user)
+        shortfalls = {
+            product: available[product.pk]
+            for product in products
+            if quantities[product.pk] > available[product.pk]
+        }
+        previous = set(StockHold.objects.filter(user=user).values_list('product_id', flat=True))
+        StockHold.objects.filter(user=user).delete()
+        if not shortfalls:
+            expires_at = timezone.now() + timedelta(seconds=ttl)
+            StockHold.objects.bulk_create([
+                StockHold(user=user, product=product,
+                          quantity=quantities[product.pk], expires_at=expires_at)
+                for product in products
+            ])
+        _changed(previous | {product.pk for product in products})
+    return shortfalls
+
+
+def release_holds(user, product_ids=None):
+    """Drop user's holds (on product_ids only, if given); returns the number dropped"""
+    holds = StockHold.objects.filter(user=user)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=list(product_ids))
+    product_ids = list(holds.values_list('product_id', flat=True))
+    if not product_ids:
+        return 0
+    deleted, _ = holds.delete()
+    _changed(product_ids)
+    return deleted
+
+
+def release_expired_holds(**kwargs):
+    """Delete expired holds in batches and give their stock back to listings"""
+    released = set()
+
+    def collect(pks):
+        released.update(StockHold.objects.filter(pk__in=pks).values_list('product_id', flat=True))
+
+    result = purge_in_batches(
+        StockHold.objects.filter(expires_at__lte=timezone.now()),
+        before_delete=collect, **kwargs
+    )
+    if released:
+        _changed(released)
+    return result
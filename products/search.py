@@ -0,0 +1,218 @@
+"""
+Full-text search backends for the product catalog
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils.module_loading import import_string
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+
+def tokenize(text):
+    """Split text into lowercase search terms"""
+    return [
+        token for token in TOKEN_RE.findall((text or '').lower())
+        if token not in STOP_WORDS
+    ]
+
+
+class BaseSearchBackend:
+    """Interface every product search backend implements"""
+
+    def index(self, product):
+        """Add or refresh a single product in the index"""
+        raise NotImplementedError
+
+    def remove(self, product_id):
+        """Drop a product from the index"""
+        raise NotImplementedError
+
+    def rebuild(self, product_ids=None):
+        """Re-index all products, or only the given ids"""
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        """Filter queryset to matches for query, ordered by relevance"""
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Postgres full-text search over the stored Product.search_vector column.
+
+    The column is covered by a GIN index and weights the product name above
+    its description, so SearchRank orders name hits first.
+    """
+    config = 'english'
+
+    def _vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (
+            SearchVector('name', weight='A', config=self.config) +
+            SearchVector('description', weight='B', config=self.config)
+        )
+
+    def index(self, product):
+        from .models import Product
+        Product.objects.filter(pk=product.pk).update(search_vector=self._vector())
+
+    def remove(self, product_id):
+        # The vector lives on the product row and goes away with it
+        pass
+
+    def rebuild(self, product_ids=None):
+        from .models import Product
+        products = Product.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        return products.update(search_vector=self._vector())
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at')
+
+
+class InProcessSearchBackend(BaseSearchBackend):
+    """
+    In-memory inverted index for SQLite and local development.
+
+    The index is built lazily from the database on the first search and
+    then kept current by the Product save/delete signals of this process.
+    Matching requires every query term; results are scored by TF-IDF with
+    name hits weighted above description hits. Every match is returned, so
+    result counts and facets stay exact.
+    """
+    name_weight = 3.0
+    description_weight = 1.0
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # term -> {product_id: weight}
+        self._documents = {}  # product_id -> set of terms
+        self._loaded = False
+
+    def _weights(self, name, description):
+        weights = defaultdict(float)
+        for term in tokenize(name):
+            weights[term] += self.name_weight
+        for term in tokenize(description):
+            weights[term] += self.description_weight
+        return weights
+
+    def _add(self, product_id, name, description):
+        weights = self._weights(name, description)
+        for term, weight in weights.items():
+            self._postings[term][product_id] = weight
+        self._documents[product_id] = set(weights)
+
+    def _discard(self, product_id):
+        for term in self._documents.pop(product_id, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.rebuild()
+
+    def index(self, product):
+        with self._lock:
+            if not self._loaded:
+                # The lazy build will pick this product up
+                return
+            self._discard(product.pk)
+            self._add(product.pk, product.name, product.description)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._discard(product_id)
+
+    def rebuild(self, product_ids=None):
+        from .models import Product
+        products = Product.objects.values_list('id', 'name', 'description')
+        with self._lock:
+            if product_ids is None:
+                self._postings.clear()
+                self._documents.clear()
+            elif not self._loaded:
+                # The lazy build will pick these products up
+                return 0
+            else:
+                products = products.filter(pk__in=product_ids)
+                for product_id in product_ids:
+                    self._discard(product_id)
+            count = 0
+            for product_id, name, description in products.iterator(chunk_size=2000):
+                self._add(product_id, name, description)
+                count += 1
+            self._loaded = True
+        return count
+
+    def ranked_ids(self, query):
+        """Return matching product ids, best match first"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            postings = [self._postings.get(term) for term in terms]
+            if not all(postings):
+                return []
+            total = len(self._documents) or 1
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            scores = {}
+            for product_id in candidates:
+                score = 0.0
+                for term_postings in postings:
+                    idf = math.log(1 + total / len(term_postings))
+                    score += term_postings[product_id] * idf
+                scores[product_id] = score
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+    def search(self, queryset, query):
+        ids = self.ranked_ids(query)
+        if not ids:
+            return queryset.none()
+        ranking = Case(
+            *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=ids).annotate(rank=ranking).order_by('rank')
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the configured search backend, chosen per database vendor by default"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', '')
+                if not path:
+                    if connection.vendor == 'postgresql':
+                        path = 'products.search.PostgresSearchBackend'
+                    else:
+                        path = 'products.search.InProcessSearchBackend'
+                _backend = import_string(path)()
+    return _backend
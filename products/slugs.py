@@ -0,0 +1,55 @@
+"""
+Set-wise unique slug allocation for products
+"""
+from collections import Counter
+
+from django.db.models import Q
+from django.utils.text import slugify
+
+from .models import Product
+
+
+SLUG_MAX_LENGTH = 200
+# Leave room for a "-<counter>" suffix within the column length
+BASE_MAX_LENGTH = SLUG_MAX_LENGTH - 10
+PREFIX_QUERY_CHUNK = 200
+
+
+def base_slug(name):
+    return slugify(name)[:BASE_MAX_LENGTH].strip('-') or 'product'
+
+
+def allocate_slugs(bases, exclude_pk=None):
+    """
+    Return a unique slug for every requested base slug, in order.
+
+    Taken slugs are looked up for the whole batch at once: one query for
+    the exact bases, plus a prefix query only for bases that collide.
+    Duplicates within the batch get successive "-<n>" suffixes.
+    """
+    existing = Product.objects.all()
+    if exclude_pk is not None:
+        existing = existing.exclude(pk=exclude_pk)
+
+    wanted = Counter(bases)
+    taken = set(existing.filter(slug__in=wanted).values_list('slug', flat=True))
+    colliding = sorted(taken)
+    colliding += sorted(base for base, count in wanted.items() if count > 1 and base not in taken)
+    for start in range(0, len(colliding), PREFIX_QUERY_CHUNK):
+        prefixes = Q()
+        for base in colliding[start:start + PREFIX_QUERY_CHUNK]:
+            prefixes |= Q(slug__startswith=f'{base}-')
+        taken.update(existing.filter(prefixes).values_list('slug', flat=True))
+
+    slugs = []
+    counters = {}
+    for base in bases:
+        slug = base
+        counter = counters.get(base, 1)
+        while slug in taken:
+            slug = f'{base}-{counter}'
+            counter += 1
+        counters[base] = counter
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
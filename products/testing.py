@@ -0,0 +1,65 @@
+"""
+Shared helpers for the products and orders test suites
+"""
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.utils.text import slugify
+
+from .models import Category, Product
+
+
+# Private in-memory caches, so a test run never touches the configured
+# file caches (live carts, version counter mirrors) of the host it runs on
+TEST_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'test-{alias}',
+    }
+    for alias in ('default', 'catalog', 'carts')
+}
+
+
+class IsolatedCachesMixin:
+    """Run a test class against TEST_CACHES, emptied before every test"""
+
+    @classmethod
+    def setUpClass(cls):
+        override = override_settings(CACHES=TEST_CACHES)
+        override.enable()
+        cls.addClassCleanup(override.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        super().setUp()
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+
+
+def make_product(name, category, **fields):
+    """Create a product with its slug and description derived from name"""
+    values = {
+        'slug': slugify(name), 'description': f'A {name.lower()}', 'price': 10, 'stock': 5,
+    }
+    values.update(fields)
+    return Product.objects.create(name=name, category=category, **values)
+
+
+class CategoryFixtureMixin:
+    """The 'Shoes' category, created once per test class"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.category = Category.objects.create(name='Shoes', slug='shoes')
+
+
+class CatalogFixtureMixin(CategoryFixtureMixin):
+    """Shoes plus a Boot (19.99, 5 in stock) and a Sock (2.50, 50 in stock)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.boot = make_product('Boot', cls.category, price=Decimal('19.99'))
+        cls.sock = make_product('Sock', cls.category, price=Decimal('2.50'), stock=50)
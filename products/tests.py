@@ -1,3 +1,870 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+
+from . import importer
+from .cache import CATALOG_VERSION_KEY, bump_catalog_version, get_catalog_version
+from .cards import build_card, rebuild_product_cards
+from .carts import (
+    CacheCartStorage, DatabaseCartStorage, add_cart_line, cart_count_key, get_cart,
+    set_cart_line_quantity,
+)
+from .categories import CategoryRegistry
+from .export import EXPORT_COLUMNS, iter_catalog_csv
+from .facets import compute_facets, get_facets
+from .models import (
+    Cart, Category, CoPurchase, Product, ProductCard, ProductRecommendation, StockHold,
+    VersionCounter,
+)
+from .pagination import KeysetPaginator, paginate_catalog
+from .pricing import database_cart_totals, quantities_totals
+from .purge import (
+    purge_expired_cached_carts, purge_expired_sessions, purge_in_batches, purge_stale_carts,
+)
+from .recommendations import TOP_N, record_order, refresh_recommendations
+from .reservations import hold_stock, release_expired_holds, release_holds
+from .search import InProcessSearchBackend, PostgresSearchBackend, get_search_backend
+from .slugs import allocate_slugs
+from .testing import (
+    TEST_CACHES, CatalogFixtureMixin, CategoryFixtureMixin, IsolatedCachesMixin, make_product,
+)
+
+
+class SearchBackendTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.boot = make_product('Leather Boot', cls.category, description='Waterproof walking boot')
+        cls.sock = make_product(
+            'Walking Sock', cls.category, description='Soft sock to wear with a boot'
+        )
+        cls.hat = make_product('Wool Hat', cls.category, description='Warm hat')
+
+    def in_process(self):
+        backend = get_search_backend()
+        if not isinstance(backend, InProcessSearchBackend):
+            self.skipTest('The in-process index is only used off Postgres')
+        backend.rebuild()
+        return backend
+
+    def test_name_hits_rank_above_description_hits(self):
+        backend = self.in_process()
+        self.assertEqual(backend.ranked_ids('boot'), [self.boot.pk, self.sock.pk])
+        self.assertEqual(backend.ranked_ids('sock'), [self.sock.pk])
+
+    def test_every_term_must_match(self):
+        backend = self.in_process()
+        self.assertEqual(set(backend.ranked_ids('walking boot')), {self.boot.pk, self.sock.pk})
+        self.assertEqual(backend.ranked_ids('wool boot'), [])
+        self.assertEqual(backend.ranked_ids('the and'), [])
+
+    def test_index_follows_product_save_and_delete(self):
+        backend = self.in_process()
+        self.hat.name = 'Boot Hat'
+        self.hat.save()
+        self.assertIn(self.hat.pk, backend.ranked_ids('boot'))
+        self.assertEqual(backend.ranked_ids('wool'), [])
+        self.boot.delete()
+        self.assertEqual(backend.ranked_ids('leather'), [])
+        self.assertNotIn(self.boot.pk, backend.ranked_ids('boot'))
+
+    def test_search_orders_queryset_by_rank(self):
+        backend = self.in_process()
+        matches = backend.search(Product.objects.all(), 'boot')
+        self.assertEqual(list(matches), [self.boot, self.sock])
+        self.assertFalse(backend.search(Product.objects.all(), 'scarf').exists())
+
+    def test_rebuild_command_rejects_the_per_process_index(self):
+        self.in_process()
+        with self.assertRaisesMessage(CommandError, 'nothing to rebuild'):
+            call_command('rebuild_search_index', stdout=StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Postgres full-text search')
+    def test_postgres_ranks_name_hits_first(self):
+        backend = PostgresSearchBackend()
+        backend.rebuild()
+        matches = backend.search(Product.objects.all(), 'boot')
+        self.assertEqual(list(matches), [self.boot, self.sock])
+
+
+class KeysetPaginationTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Mostly equal prices, so pages must break ties on id
+        for i, price in enumerate([10, 10, 5, 10, 10, 5, 10]):
+            make_product(f'Boot {i}', cls.category, description='A boot', price=price)
+
+    def setUp(self):
+        super().setUp()
+        self.cards = ProductCard.objects.all()
+        self.expected = list(self.cards.order_by('price', 'id').values_list('pk', flat=True))
+
+    def walk_forward(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([card.pk for card in page])
+            if not page.has_next():
+                return pages, page
+            cursor = page.next_cursor
+
+    def test_next_cursors_visit_every_row_once_across_equal_prices(self):
+        pages, last = self.walk_forward(KeysetPaginator(self.cards, ('price', 'id'), per_page=2))
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertTrue(last.has_previous())
+        self.assertIsNone(last.next_cursor)
+
+    def test_previous_cursors_retrace_the_same_pages(self):
+        paginator = KeysetPaginator(self.cards, ('price', 'id'), per_page=2)
+        pages, page = self.walk_forward(paginator)
+        retraced = [[card.pk for card in page]]
+        while page.has_previous():
+            page = paginator.get_page(page.previous_cursor)
+            retraced.insert(0, [card.pk for card in page])
+        self.assertEqual(retraced, pages)
+        self.assertFalse(page.has_previous())
+
+    def test_descending_sort_and_bad_cursor(self):
+        paginator = KeysetPaginator(self.cards, ('-price', '-id'), per_page=3)
+        pages, _ = self.walk_forward(paginator)
+        self.assertEqual(sum(pages, []), list(reversed(self.expected)))
+        self.assertEqual([card.pk for card in paginator.get_page('not-a-cursor')], pages[0])
+
+    def test_page_parameter_falls_back_to_numbered_pages(self):
+        request = RequestFactory().get('/products/', {'page': 2})
+        page = paginate_catalog(request, self.cards.order_by('price'), 'relevance', per_page=3)
+        self.assertFalse(getattr(page, 'is_cursor_page', False))
+        self.assertEqual((page.number, page.paginator.num_pages), (2, 3))
+        with override_settings(CATALOG_PAGINATION='offset'):
+            page = paginate_catalog(request, self.cards.order_by('price', 'id'), 'price', per_page=3)
+        self.assertEqual([card.pk for card in page], self.expected[3:6])
+
+    def test_numbered_page_links_keep_the_filters(self):
+        request = RequestFactory().get('/products/', {'q': 'boot', 'category': 'shoes', 'page': 2})
+        page = paginate_catalog(request, self.cards.order_by('price'), 'relevance', per_page=3)
+        self.assertEqual(page.previous_querystring, 'q=boot&category=shoes&page=1')
+        self.assertEqual(page.next_querystring, 'q=boot&category=shoes&page=3')
+        self.assertEqual(
+            [querystring for _, querystring in page.page_links],
+            [f'q=boot&category=shoes&page={number}' for number in (1, 2, 3)],
+        )
+
+    def test_search_results_link_to_later_pages_of_the_same_search(self):
+        for i in range(12):
+            make_product(f'Tall Boot {i}', self.category, price=5)
+        response = self.client.get(reverse('products:product_list'), {'q': 'boot'})
+        self.assertNotContains(response, 'href="?page=')
+        self.assertContains(response, 'href="?q=boot&amp;page=1"')
+
+
+class ProductCardTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product = make_product('Boot', cls.category, description='x' * 400)
+
+    def card(self):
+        return ProductCard.objects.get(pk=self.product.pk)
+
+    def test_card_is_created_with_product(self):
+        card = self.card()
+        self.assertEqual((card.name, card.slug, card.price), ('Boot', 'boot', 10))
+        self.assertEqual((card.category_name, card.category_slug), ('Shoes', 'shoes'))
+        self.assertEqual(len(card.summary), 300)
+        self.assertEqual(card.created_at, self.product.created_at)
+
+    def test_card_follows_product_save_and_delete(self):
+        self.product.name, self.product.price, self.product.available = 'Tall Boot', 12, False
+        self.product.save()
+        card = self.card()
+        self.assertEqual((card.name, card.price, card.available), ('Tall Boot', 12, False))
+        self.product.delete()
+        self.assertFalse(ProductCard.objects.exists())
+
+    def test_category_rename_reaches_cards(self):
+        self.category.name, self.category.slug = 'Footwear', 'footwear'
+        self.category.save()
+        card = self.card()
+        self.assertEqual((card.category_name, card.category_slug), ('Footwear', 'footwear'))
+
+    def test_rebuild_restores_drifted_and_drops_orphaned_cards(self):
+        ProductCard.objects.filter(pk=self.product.pk).update(name='Stale', stock=99)
+        orphan = build_card(self.product)
+        orphan.pk = self.product.pk + 1000
+        orphan.save()
+        self.assertEqual(rebuild_product_cards(batch_size=1), 1)
+        self.assertEqual(list(ProductCard.objects.values_list('pk', 'name', 'stock')),
+                         [(self.product.pk, 'Boot', 5)])
+
+
+class CatalogVersionTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    def test_product_writes_bump_the_version_on_commit(self):
+        before = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('Boot', self.category)
+            self.assertEqual(get_catalog_version(), before)
+        self.assertGreater(get_catalog_version(), before)
+
+    def test_bumps_count_in_the_database_not_the_cache(self):
+        before = get_catalog_version()
+        # A stale mirror must not decide the next version
+        cache.set(CATALOG_VERSION_KEY, before - 5)
+        bumped = bump_catalog_version()
+        self.assertGreater(bumped, before)
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertEqual(get_catalog_version(), bumped)
+
+    def test_mirror_catches_up_with_a_racing_bump(self):
+        get_catalog_version()
+        set_mirror = cache.set
+        written = []
+
+        def racing_set(key, value, timeout):
+            set_mirror(key, value, timeout)
+            if not written:
+                # Another worker bumps between this mirror write and the re-read
+                VersionCounter.objects.filter(key=key).update(value=F('value') + 1)
+            written.append(value)
+
+        with mock.patch.object(cache, 'set', racing_set):
+            bump_catalog_version()
+        self.assertEqual(cache.get(CATALOG_VERSION_KEY), written[0] + 1)
+
+
+class CategoryRegistryTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = CategoryRegistry()
+
+    def test_reloads_only_after_the_write_commits(self):
+        self.assertEqual(self.registry.all(), [self.category])
+        with self.captureOnCommitCallbacks(execute=True):
+            hats = Category.objects.create(name='Hats', slug='hats')
+            self.assertEqual(self.registry.all(), [self.category])
+        self.assertEqual(self.registry.all(), [hats, self.category])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.registry.get('hats'), hats)
+
+    @override_settings(CATEGORY_REGISTRY_TTL=0)
+    def test_copy_expires_without_a_bump(self):
+        self.registry.all()
+        Category.objects.filter(pk=self.category.pk).update(name='Footwear')
+        self.assertEqual(self.registry.get('shoes').name, 'Footwear')
+
+
+class FacetTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hats = Category.objects.create(name='Hats', slug='hats')
+        for name, category, price, available in [
+            ('Boot', cls.category, 5, True),
+            ('Sandal', cls.category, 30, True),
+            ('Slipper', cls.category, 30, False),
+            ('Cap', cls.hats, 12, True),
+            ('Wool Hat', cls.hats, 60, True),
+        ]:
+            make_product(name, category, price=price, available=available)
+
+    def test_unfiltered_counts(self):
+        facets = compute_facets()
+        self.assertEqual(facets['category_counts'], {self.category.pk: 2, self.hats.pk: 2})
+        self.assertEqual(facets['bucket_counts'], [1, 1, 1, 1, 0, 0])
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = compute_facets(category_id=self.category.pk, min_price='10', max_price='50')
+        # Category counts honour the price filter only
+        self.assertEqual(facets['category_counts'], {self.category.pk: 1, self.hats.pk: 1})
+        # The histogram honours the category filter only
+        self.assertEqual(facets['bucket_counts'], [1, 0, 1, 0, 0, 0])
+
+    def test_search_narrows_every_facet(self):
+        facets = compute_facets(search_query='wool')
+        self.assertEqual(facets['category_counts'], {self.hats.pk: 1})
+        self.assertEqual(facets['bucket_counts'], [0, 0, 0, 1, 0, 0])
+
+    def test_facets_are_cached_per_filter(self):
+        first = get_facets(category=self.hats)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_facets(category=self.hats), first)
+        counts = {facet['category'].slug: facet['count'] for facet in first['categories']}
+        self.assertEqual(counts, {'hats': 2, 'shoes': 2})
+        self.assertEqual([bucket['count'] for bucket in first['price_buckets']], [0, 1, 0, 1, 0, 0])
+
+
+class RecommendationTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ids = [
+            make_product(f'Boot {i}', cls.category, description='A boot').pk
+            for i in range(TOP_N + 3)
+        ]
+
+    def neighbours(self, product_id):
+        return ProductRecommendation.objects.get(pk=product_id).neighbour_ids
+
+    def test_order_counts_pairs_and_ranks_neighbours(self):
+        a, b, c = self.ids[:3]
+        record_order([a, b, c])
+        record_order([a, c])
+        self.assertEqual(CoPurchase.objects.get(product_id=a, other_id=c).count, 2)
+        self.assertEqual(self.neighbours(a), [c, b])
+        self.assertEqual(self.neighbours(b), [a, c])
+
+    def test_refresh_is_one_query_and_keeps_the_top_n(self):
+        record_order(self.ids)
+        with self.assertNumQueries(2):  # Windowed read, one upsert
+            refresh_recommendations(self.ids)
+        self.assertEqual(self.neighbours(self.ids[0]), self.ids[1:TOP_N + 1])
+        self.assertEqual(len(self.neighbours(self.ids[-1])), TOP_N)
+
+
+class ConditionalGetTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    url = reverse_lazy('products:product_detail', args=['boot'])
+
+    def test_unchanged_product_answers_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=60', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_validators_change_after_an_edit(self):
+        etag = self.client.get(self.url)['ETag']
+        self.boot.price = 12
+        self.boot.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bulk_stock_update_moves_last_modified(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        # Checkout takes stock with a bulk UPDATE, then bumps the catalog
+        Product.objects.filter(pk=self.boot.pk).update(stock=3)
+        with mock.patch('products.cache.time.time', return_value=time.time() + 5):
+            bump_catalog_version()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '3 available')
+
+    def test_listing_etag_follows_the_catalog_version(self):
+        url = reverse('products:product_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        bump_catalog_version()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_signed_in_visitors_get_private_full_responses(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(User.objects.create_user('shopper', password='x'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+
+class CatalogExportTests(IsolatedCachesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Shoes, Boots & "More"', slug='shoes')
+        self.descriptions = ['Plain', 'Has, a comma', 'Says "hi"', 'Two\nlines']
+        for i, description in enumerate(self.descriptions):
+            Product.objects.create(
+                name=f'Boot {i}', slug=f'boot-{i}', category=category,
+                description=description, price='9.50', stock=i,
+            )
+
+    def test_csv_rows_survive_escaping(self):
+        lines = list(iter_catalog_csv(base_url='https://shop.example', chunk_size=2))
+        self.assertEqual(len(lines), 1 + len(self.descriptions))
+        rows = list(csv.reader(lines))
+        self.assertEqual(rows[0], EXPORT_COLUMNS)
+        records = [dict(zip(rows[0], row)) for row in rows[1:]]
+        self.assertEqual([record['description'] for record in records], self.descriptions)
+        self.assertEqual(records[0]['category'], 'Shoes, Boots & "More"')
+        self.assertEqual(records[0]['price'], '9.50')
+        self.assertEqual(records[0]['url'], 'https://shop.example/product/boot-0/')
+
+    def test_staff_endpoint_streams_one_chunk_per_row(self):
+        User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.login(username='staff', password='x')
+        response = self.client.get(reverse('products:catalog_export'), {'format': 'jsonl'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="catalog.jsonl"')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), len(self.descriptions))
+        self.assertEqual(json.loads(chunks[3])['description'], 'Two\nlines')
+        response = self.client.get(reverse('products:catalog_export'))
+        self.assertEqual(len(list(response.streaming_content)), 1 + len(self.descriptions))
+
+
+class ProductImportTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    header = 'name,slug,category,description,price,stock\n'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.boot = make_product('Boot', cls.category)
+
+    def run_import(self, body, **kwargs):
+        return importer.import_products(StringIO(self.header + body), **kwargs)
+
+    def test_existing_slugs_update_and_the_rest_insert(self):
+        result = self.run_import(
+            'Boot,boot,shoes,Relaunched boot,12.00,9\n'
+            'Boot,,Shoes,Another boot,11,1\n'
+            'Sock,,shoes,A sock,2,10\n'
+            'Sock,,shoes,Another sock,2,10\n'
+            'Hat,,hats,A hat,5,1\n'
+            'Scarf,,shoes,A scarf,cheap,1\n',
+            batch_size=4,
+        )
+        self.assertEqual((result.created, result.updated), (3, 1))
+        self.assertEqual([line for line, _ in result.errors], [7, 6])
+        self.boot.refresh_from_db()
+        self.assertEqual((self.boot.price, self.boot.stock), (Decimal('12.00'), 9))
+        self.assertEqual(
+            sorted(Product.objects.values_list('slug', flat=True)),
+            ['boot', 'boot-1', 'sock', 'sock-1'],
+        )
+        self.assertEqual(ProductCard.objects.count(), 4)
+
+    def test_non_finite_price_and_huge_stock_are_row_errors(self):
+        result = self.run_import(
+            'Sock,,shoes,A sock,NaN,1\n'
+            'Hat,,shoes,A hat,5,2147483648\n'
+            'Scarf,,shoes,A scarf,5,2147483647\n',
+        )
+        self.assertEqual(result.created, 1)
+        self.assertEqual(
+            result.errors,
+            [(2, "invalid price 'NaN'"), (3, 'stock out of range: 2147483648')],
+        )
+        self.assertEqual(Product.objects.get(slug='scarf').stock, 2147483647)
+
+    def test_allocate_slugs_skips_taken_and_batch_duplicates(self):
+        make_product('Boot', self.category, slug='boot-1')
+        self.assertEqual(allocate_slugs(['boot', 'boot', 'hat', 'hat']),
+                         ['boot-2', 'boot-3', 'hat', 'hat-1'])
+        self.assertEqual(allocate_slugs(['boot'], exclude_pk=self.boot.pk), ['boot'])
+
+    def test_slug_taken_by_a_concurrent_import_is_reallocated(self):
+        allocate = importer.allocate_slugs
+        calls = []
+
+        def racing_allocate(bases):
+            slugs = allocate(bases)
+            if not calls:
+                # Another import commits the same slugs first
+                for slug in slugs:
+                    make_product('Rival', self.category, slug=slug)
+            calls.append(slugs)
+            return slugs
+
+        with mock.patch.object(importer, 'allocate_slugs', racing_allocate):
+            result = self.run_import('Hat,hat,shoes,A hat,5,1\nCap,,shoes,A cap,5,1\n')
+        self.assertEqual(result.errors, [])
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(calls, [['hat', 'cap'], ['cap-1']])
+        self.assertEqual(Product.objects.get(slug='hat').name, 'Hat')
+
+    def test_persistent_collisions_are_reported_not_raised(self):
+        with mock.patch.object(importer, 'write_batch', side_effect=IntegrityError):
+            result = self.run_import('Hat,,shoes,A hat,5,1\n')
+        self.assertEqual(result.rows, 0)
+        self.assertEqual([line for line, _ in result.errors], [2])
+
+
+class CartStorageTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+
+    def exercise(self, storage_class):
+        """Run one script of cart operations and record what the cart reports"""
+        cart = storage_class(None, user=self.user)
+        seen = [
+            cart.add(self.boot, 2),
+            cart.add(self.sock, 3),
+            cart.add(self.boot, 9),  # Capped at stock
+            list(cart.quantities().items()),
+            cart.count(),
+            cart.set_quantity(self.sock, 7),
+            cart.set_quantity(self.sock, 0),
+            cart.set_quantity(self.sock, 1),  # No longer in the cart
+            cart.update_quantities({self.boot.pk: 3, self.sock.pk: 1}),
+            str(cart.totals().subtotal),
+            [(line.product_id, line.quantity) for line in cart.lines()],
+            cart.remove(self.boot.pk),
+            cart.remove(self.boot.pk),
+            cart.is_empty(),
+        ]
+        cart.add(self.sock, 1)
+        cart.clear()
+        seen.append(cart.quantities())
+        return seen
+
+    def test_database_and_cache_storage_behave_alike(self):
+        expected = [
+            2, 3, 5, [(self.sock.pk, 3), (self.boot.pk, 5)], 2,
+            7, 0, None, {self.boot.pk: 3}, '59.97', [(self.boot.pk, 3)],
+            1, 0, True, {},
+        ]
+        self.assertEqual(self.exercise(DatabaseCartStorage), expected)
+        self.assertEqual(self.exercise(CacheCartStorage), expected)
+
+    def test_guest_cart_merges_into_account_on_login(self):
+        add_cart_line(self.user.pk, self.boot.pk, 4)
+        self.client.post(reverse('products:add_to_cart', args=['boot']), {'quantity': 3})
+        self.client.post(reverse('products:add_to_cart', args=['sock']), {'quantity': 2})
+        cart_id = self.client.session[CacheCartStorage.session_key]
+        self.assertEqual(len(caches['carts'].get(f'cart:anon:{cart_id}')), 2)
+
+        self.client.login(username='shopper', password='x')
+        self.assertEqual(
+            DatabaseCartStorage(None, user=self.user).quantities(),
+            {self.sock.pk: 2, self.boot.pk: 5},
+        )
+        self.assertNotIn(CacheCartStorage.session_key, self.client.session)
+        self.assertIsNone(caches['carts'].get(f'cart:anon:{cart_id}'))
+
+    def test_cache_cart_drops_lines_of_deleted_products(self):
+        self.client.post(reverse('products:add_to_cart', args=['boot']), {'quantity': 1})
+        self.client.post(reverse('products:add_to_cart', args=['sock']), {'quantity': 2})
+        key = f'cart:anon:{self.client.session[CacheCartStorage.session_key]}'
+        self.sock.delete()
+        cart = CacheCartStorage(self.client, user=AnonymousUser())
+        self.assertEqual((cart.count(), cart.quantities()), (1, {self.boot.pk: 1}))
+        self.assertEqual(caches['carts'].get(key), {self.boot.pk: 1})
+
+    def test_line_of_a_deleted_product_can_be_removed(self):
+        self.client.post(reverse('products:add_to_cart', args=['sock']), {'quantity': 2})
+        key = f'cart:anon:{self.client.session[CacheCartStorage.session_key]}'
+        url = reverse('products:remove_from_cart', args=[self.sock.pk])
+        self.sock.delete()
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('products:cart'))
+        self.assertIsNone(caches['carts'].get(key))
+
+    def test_badge_counter_is_shared_and_recounted_when_missing(self):
+        add_cart_line(self.user.pk, self.boot.pk, 1)
+        self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 1)
+        # Another worker's storage sees the same counter and adjusts it
+        other = DatabaseCartStorage(None, user=self.user)
+        other.add(self.sock, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 2)
+        caches['carts'].delete(cart_count_key(self.user.pk))
+        with self.assertNumQueries(1):
+            self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 2)
+
+    def test_cascade_deletes_drop_the_badge_counter(self):
+        add_cart_line(self.user.pk, self.boot.pk, 1)
+        add_cart_line(self.user.pk, self.sock.pk, 1)
+        self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sock.delete()
+        self.assertIsNone(caches['carts'].get(cart_count_key(self.user.pk)))
+        self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 1)
+
+    def test_get_cart_picks_storage_by_user(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        self.assertIsInstance(get_cart(request), DatabaseCartStorage)
+        with override_settings(CART_STORAGE='products.carts.CacheCartStorage'):
+            del request._cart
+            self.assertIsInstance(get_cart(request), CacheCartStorage)
+
+
+class CartBatchUpdateTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    url = reverse_lazy('products:update_cart_lines')
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+        cls.hat = make_product('Hat', cls.category, stock=3)
+        cls.cap = make_product('Cap', cls.category, stock=3)
+        for product in (cls.boot, cls.sock, cls.hat):
+            add_cart_line(cls.user.pk, product.pk, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_partial_success_reports_each_line(self):
+        response = self.post({'quantities': {
+            str(self.boot.pk): 9,  # Capped at stock
+            str(self.sock.pk): 4,
+            str(self.hat.pk): 0,  # Removed
+            str(self.cap.pk): 2,  # Not in the cart
+        }})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            {line['product_id']: line['quantity'] for line in data['lines']},
+            {self.boot.pk: 5, self.sock.pk: 4},
+        )
+        self.assertEqual(data['capped'], [self.boot.pk])
+        self.assertEqual(data['not_in_cart'], [self.cap.pk])
+        self.assertEqual((data['count'], data['subtotal']), (2, '109.95'))
+        self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 2)
+
+    def test_bad_requests_change_nothing(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        for body in ['not json', json.dumps({'lines': {}}), json.dumps({'quantities': {'x': 1}})]:
+            response = self.client.post(self.url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 3)
+
+
+class PurgeTests(IsolatedCachesMixin, CategoryFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.products = [make_product(f'Boot {i}', cls.category) for i in range(3)]
+        cls.users = [User.objects.create_user(f'shopper{i}', password='x') for i in range(4)]
+
+    def age(self, user, days):
+        Cart.objects.filter(user=user).update(added_at=timezone.now() - timedelta(days=days))
+
+    def test_batches_walk_the_keyset_and_recheck_the_filter(self):
+        for user in self.users:
+            for product in self.products:
+                add_cart_line(user.pk, product.pk, 1)
+        seen = []
+
+        def before_delete(pks):
+            seen.append(pks)
+            if len(seen) == 2:
+                # A row changed after the batch was picked; it must survive
+                Cart.objects.filter(pk=pks[0]).update(quantity=2)
+
+        result = purge_in_batches(
+            Cart.objects.filter(quantity=1), batch_size=5, pause=0, before_delete=before_delete
+        )
+        self.assertEqual([len(pks) for pks in seen], [5, 5, 2])
+        self.assertEqual(sum(seen, []), sorted(sum(seen, [])))
+        self.assertEqual((result.deleted, result.batches), (11, 3))
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [seen[1][0]])
+
+    def test_stale_carts_spare_recently_active_users(self):
+        stale, mixed, fresh = self.users[:3]
+        for user in (stale, mixed, fresh):
+            add_cart_line(user.pk, self.products[0].pk, 1)
+        self.age(stale, 40)
+        self.age(mixed, 40)
+        add_cart_line(mixed.pk, self.products[1].pk, 1)
+        DatabaseCartStorage(None, user=stale).count()  # Warm the badge counter
+        with self.captureOnCommitCallbacks(execute=True):
+            result = purge_stale_carts(days=30, batch_size=1, pause=0)
+        self.assertEqual(result.deleted, 1)
+        self.assertEqual(set(Cart.objects.values_list('user', flat=True)), {mixed.pk, fresh.pk})
+        self.assertIsNone(caches['carts'].get(cart_count_key(stale.pk)))
+
+    def test_expired_sessions_and_command(self):
+        now = timezone.now()
+        for i in range(3):
+            Session.objects.create(
+                session_key=f'old{i}', session_data='', expire_date=now - timedelta(days=1)
+            )
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        self.assertEqual(purge_expired_sessions(batch_size=2, pause=0).batches, 2)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        out = StringIO()
+        call_command('purge_stale', '--pause', '0', stdout=out)
+        self.assertIn('Sessions: deleted 0 rows', out.getvalue())
+
+
+    def test_cart_cache_never_culls_and_sweeps_expired_carts(self):
+        with tempfile.TemporaryDirectory() as location:
+            file_caches = {**TEST_CACHES, 'carts': {
+                'BACKEND': 'products.cache_backends.CartFileCache',
+                'LOCATION': location,
+                'OPTIONS': {'MAX_ENTRIES': 2},
+            }}
+            with override_settings(CACHES=file_caches):
+                carts = caches['carts']
+                for i in range(5):
+                    carts.set(f'cart:anon:{i}', {i: 1})
+                carts.set('cart:anon:gone', {9: 1}, timeout=0)
+                self.assertEqual(purge_expired_cached_carts().deleted, 1)
+                self.assertEqual(
+                    [carts.get(f'cart:anon:{i}') for i in range(5)], [{i: 1} for i in range(5)]
+                )
+
+
+class CartLineTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+
+    def test_add_creates_then_increments(self):
+        self.assertEqual(add_cart_line(self.user.pk, self.boot.pk, 2), (2, True))
+        self.assertEqual(add_cart_line(self.user.pk, self.boot.pk, 2), (4, False))
+
+    def test_add_is_capped_at_stock(self):
+        add_cart_line(self.user.pk, self.boot.pk, 4)
+        self.assertEqual(add_cart_line(self.user.pk, self.boot.pk, 4), (5, False))
+        self.assertEqual(add_cart_line(self.user.pk, self.boot.pk, 9)[0], 5)
+
+    def test_add_out_of_stock_product(self):
+        Product.objects.filter(pk=self.boot.pk).update(stock=0)
+        self.assertEqual(add_cart_line(self.user.pk, self.boot.pk, 1), (0, False))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_set_quantity_is_capped_at_stock(self):
+        add_cart_line(self.user.pk, self.boot.pk, 1)
+        self.assertEqual(set_cart_line_quantity(self.user.pk, self.boot.pk, 50), 5)
+        self.assertEqual(Cart.objects.get().quantity, 5)
+
+    def test_set_quantity_of_missing_line(self):
+        self.assertIsNone(set_cart_line_quantity(self.user.pk, self.boot.pk, 2))
+
+    def test_set_quantity_deletes_line_when_out_of_stock(self):
+        add_cart_line(self.user.pk, self.boot.pk, 2)
+        Product.objects.filter(pk=self.boot.pk).update(stock=0)
+        self.assertEqual(set_cart_line_quantity(self.user.pk, self.boot.pk, 3), 0)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_update_view_removes_sold_out_line_and_badge(self):
+        self.client.force_login(self.user)
+        storage = DatabaseCartStorage(None, user=self.user)
+        storage.add(self.boot, 2)
+        self.assertEqual(storage.count(), 1)
+        # The in-memory product the view loads may still show stock
+        Product.objects.filter(pk=self.boot.pk).update(stock=0)
+        response = self.client.post(
+            reverse('products:update_cart', args=[self.boot.pk]), {'quantity': 1}, follow=True
+        )
+        self.assertContains(response, 'Item removed from cart.')
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(DatabaseCartStorage(None, user=self.user).count(), 0)
+
+
+class CartPricingTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = User.objects.create_user('shopper', password='x')
+
+    def test_database_totals(self):
+        add_cart_line(self.user.pk, self.boot.pk, 2)
+        add_cart_line(self.user.pk, self.sock.pk, 3)
+        with self.assertNumQueries(1):
+            totals = database_cart_totals(Cart.objects.filter(user=self.user))
+        self.assertEqual(str(totals.subtotal), '47.48')
+        self.assertEqual((totals.line_count, totals.item_count), (2, 5))
+        self.assertEqual(totals.total_in_cents, 4748)
+
+    def test_empty_cart_totals(self):
+        totals = database_cart_totals(Cart.objects.filter(user=self.user))
+        self.assertTrue(totals.is_empty)
+        self.assertEqual(str(totals.subtotal), '0.00')
+        self.assertEqual(quantities_totals({}), totals)
+
+    def test_quantities_totals(self):
+        totals = quantities_totals({self.boot.pk: 1, self.sock.pk: 4})
+        self.assertEqual(str(totals.subtotal), '29.99')
+        self.assertEqual((totals.line_count, totals.item_count), (2, 5))
+
+
+class StockHoldTests(IsolatedCachesMixin, CatalogFixtureMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.alice = User.objects.create_user('alice', password='x')
+        cls.bob = User.objects.create_user('bob', password='x')
+
+    def card_stock(self):
+        return ProductCard.objects.get(pk=self.boot.pk).stock
+
+    def test_hold_reduces_available_to_sell(self):
+        self.assertEqual(hold_stock(self.alice, {self.boot.pk: 3}), {})
+        self.assertEqual(self.card_stock(), 2)
+        self.assertEqual(hold_stock(self.bob, {self.boot.pk: 3}), {self.boot: 2})
+        self.assertFalse(StockHold.objects.filter(user=self.bob).exists())
+
+    def test_new_hold_replaces_previous(self):
+        hold_stock(self.alice, {self.boot.pk: 3})
+        self.assertEqual(hold_stock(self.alice, {self.boot.pk: 5}), {})
+        self.assertEqual(StockHold.objects.get().quantity, 5)
+        self.assertEqual(self.card_stock(), 0)
+        release_holds(self.alice)
+        self.assertEqual(self.card_stock(), 5)
+
+    def test_expired_holds_free_stock_and_are_swept(self):
+        hold_stock(self.alice, {self.boot.pk: 4}, ttl=60)
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(hold_stock(self.bob, {self.boot.pk: 5}), {})
+        result = release_expired_holds(pause=0)
+        self.assertEqual(result.deleted, 1)
+        self.assertEqual(list(StockHold.objects.values_list('user', flat=True)), [self.bob.pk])
+
+
+class CartLineConcurrencyTests(IsolatedCachesMixin, TransactionTestCase):
+    threads = 12
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('shopper', password='x')
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product = make_product('Boot', category, stock=1000)
+
+    def hammer(self, quantity):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                add_cart_line(self.user.pk, self.product.pk, quantity)
+            except Exception as exc:  # surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        return Cart.objects.get(user=self.user, product=self.product).quantity
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_adds_do_not_lose_increments(self):
+        self.assertEqual(self.hammer(3), self.threads * 3)
+        self.assertEqual(Cart.objects.count(), 1)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_adds_never_exceed_stock(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=20)
+        self.assertEqual(self.hammer(3), 20)
@@ -18,6 +18,7 @@ urlpatterns = [
     path('product/create/', views.product_create, name='product_create'),
     path('product/<slug:slug>/edit/', views.product_edit, name='product_edit'),
     path('product/<slug:slug>/delete/', views.product_delete, name='product_delete'),
+    path('catalog/export/', views.catalog_export, name='catalog_export'),
     
     # Product detail (comes AFTER specific routes)
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
@@ -25,6 +26,7 @@ urlpatterns = [
     # Cart
     path('cart/', views.cart, name='cart'),
     path('cart/add/<slug:slug>/', views.add_to_cart, name='add_to_cart'),
-    path('cart/update/<int:item_id>/', views.update_cart, name='update_cart'),
-    path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/update/', views.update_cart_lines, name='update_cart_lines'),
+    path('cart/update/<int:product_id>/', views.update_cart, name='update_cart'),
+    path('cart/remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
 ]
\ No newline at end of file
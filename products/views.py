@@ -1,105 +1,133 @@
 """
 Views for products app
 """
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
-from .models import Product, Category, Cart
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from .models import Product, ProductCard
+from .cache import cached_fragment
+from .cards import cards_in_order
+from .carts import get_cart
+from .categories import category_registry
+from .conditional import catalog_condition, listing_etag, product_etag, product_last_modified
+from .facets import get_facets
+from .pagination import paginate_catalog, paginate_numbered
+from .recommendations import related_products as related_products_for
+from .search import get_search_backend
 
 
 def home(request):
     """Homepage with featured products and categories"""
-    categories = Category.objects.all()[:6]
-    featured_products = Product.objects.filter(available=True)[:8]
+    category_facets = get_facets()['categories'][:6]
+    featured_products = ProductCard.objects.filter(available=True)[:8]
     
     context = {
-        'categories': categories,
+        'category_facets': category_facets,
         'featured_products': featured_products,
     }
     return render(request, 'products/home.html', context)
 
 
+@catalog_condition(etag_func=listing_etag)
 def product_list(request):
     """Display all products with filters and sorting"""
-    products = Product.objects.filter(available=True)
-    categories = Category.objects.all()
+    filters = {'available': True}
+    categories = category_registry.all()
     
     # Category filter
     category_slug = request.GET.get('category')
     category = None
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
-    
-    # Search filter
-    search_query = request.GET.get('q')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
+        category = category_registry.get_or_404(category_slug)
+        filters['category'] = category
     
     # Price filter
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
     if min_price:
-        products = products.filter(price__gte=min_price)
+        filters['price__gte'] = min_price
     if max_price:
-        products = products.filter(price__lte=max_price)
+        filters['price__lte'] = max_price
     
-    # Sorting
-    sort_by = request.GET.get('sort', '-created_at')
-    if sort_by in ['name', '-name', 'price', '-price', '-created_at']:
-        products = products.order_by(sort_by)
+    search_query = request.GET.get('q')
     
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    products = paginator.get_page(page_number)
+    def build_grid():
+        # Listings read from the card projection; filters apply to both
+        products = ProductCard.objects.filter(**filters)
+        
+        # Search filter (results come back ranked by relevance)
+        matches = None
+        if search_query:
+            matches = get_search_backend().search(Product.objects.filter(**filters), search_query)
+        
+        # Sorting (an explicit sort overrides relevance ranking)
+        default_sort = 'relevance' if search_query else '-created_at'
+        sort_by = request.GET.get('sort', default_sort)
+        if sort_by in ['name', '-name', 'price', '-price', '-created_at']:
+            products = products.order_by(sort_by)
+            if matches is not None:
+                products = products.filter(id__in=matches.values('id'))
+        elif search_query:
+            sort_by = 'relevance'
+        else:
+            sort_by = '-created_at'
+        
+        # Pagination
+        if sort_by == 'relevance':
+            products = paginate_numbered(request, matches.values_list('id', flat=True))
+            products.object_list = cards_in_order(products.object_list)
+        else:
+            products = paginate_catalog(request, products, sort_by)
+        return {'products': products}
     
     context = {
-        'products': products,
+        'product_grid': cached_fragment('grid', request, 'products/product_grid.html', build_grid),
         'categories': categories,
         'category': category,
+        'search_query': search_query,
+        'facets': get_facets(search_query, category, min_price, max_price),
     }
     return render(request, 'products/product_list.html', context)
 
 
+@catalog_condition(etag_func=listing_etag)
 def category_products(request, slug):
     """Display products by category"""
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category, available=True)
-    categories = Category.objects.all()
+    category = category_registry.get_or_404(slug)
+    categories = category_registry.all()
     
-    # Sorting
-    sort_by = request.GET.get('sort', '-created_at')
-    if sort_by in ['name', '-name', 'price', '-price', '-created_at']:
-        products = products.order_by(sort_by)
-    
-    # Pagination
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get('page')
-    products = paginator.get_page(page_number)
+    def build_grid():
+        products = ProductCard.objects.filter(category=category, available=True)
+        
+        # Sorting
+        sort_by = request.GET.get('sort', '-created_at')
+        if sort_by in ['name', '-name', 'price', '-price', '-created_at']:
+            products = products.order_by(sort_by)
+        else:
+            sort_by = '-created_at'
+        
+        # Pagination
+        products = paginate_catalog(request, products, sort_by)
+        return {'products': products}
     
     context = {
-        'products': products,
+        'product_grid': cached_fragment('grid', request, 'products/product_grid.html', build_grid),
         'categories': categories,
         'category': category,
+        'facets': get_facets(category=category),
     }
     return render(request, 'products/product_list.html', context)
 
 
+@catalog_condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def product_detail(request, slug):
     """Display single product details"""
-    product = get_object_or_404(Product, slug=slug)
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
     
-    # Get related products from same category
-    related_products = Product.objects.filter(
-        category=product.category,
-        available=True
-    ).exclude(id=product.id)[:4]
+    # Frequently bought together, falling back to the same category
+    related_products = related_products_for(product)
     
     context = {
         'product': product,
@@ -108,24 +136,19 @@ def product_detail(request, slug):
     return render(request, 'products/product_detail.html', context)
 
 
-@login_required
 def cart(request):
-    """Display user's shopping cart"""
-    cart_items = Cart.objects.filter(user=request.user).select_related('product')
-    
-    # Calculate subtotal
-    subtotal = sum(item.total_price for item in cart_items)
-    total = subtotal  # no tax included
+    """Display the visitor's shopping cart"""
+    cart = get_cart(request)
+    totals = cart.totals()
     
     context = {
-        'cart_items': cart_items,
-        'subtotal': subtotal,
-        'total': total,
+        'cart_items': cart.lines(),
+        'subtotal': totals.subtotal,
+        'total': totals.total,
     }
     return render(request, 'products/cart.html', context)
 
 
-@login_required
 def add_to_cart(request, slug):
     """Add product to cart"""
     if request.method == 'POST':
@@ -137,20 +160,12 @@ def add_to_cart(request, slug):
             messages.error(request, f'Only {product.stock} items available in stock.')
             return redirect('products:product_detail', slug=slug)
         
-        # Check if product already in cart
-        cart_item, created = Cart.objects.get_or_create(
-            user=request.user,
-            product=product,
-            defaults={'quantity': quantity}
-        )
+        new_quantity = get_cart(request).add(product, quantity)
         
-        if not created:
-            # Update quantity if item already exists
-            cart_item.quantity += quantity
-            if cart_item.quantity > product.stock:
-                cart_item.quantity = product.stock
+        # quantity <= stock here, so a larger line means it was already in the cart
+        if new_quantity > quantity:
+            if new_quantity == product.stock:
                 messages.warning(request, f'Maximum {product.stock} items allowed.')
-            cart_item.save()
             messages.success(request, f'Updated {product.name} quantity in cart.')
         else:
             messages.success(request, f'Added {product.name} to cart.')
@@ -160,36 +175,76 @@ def add_to_cart(request, slug):
     return redirect('products:product_list')
 
 
-@login_required
-def update_cart(request, item_id):
+def update_cart(request, product_id):
     """Update cart item quantity"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, id=item_id, user=request.user)
+        product = get_object_or_404(Product, pk=product_id)
         quantity = int(request.POST.get('quantity', 1))
         
-        if quantity > cart_item.product.stock:
-            messages.error(request, f'Only {cart_item.product.stock} items available.')
-            quantity = cart_item.product.stock
+        if quantity > product.stock:
+            messages.error(request, f'Only {product.stock} items available.')
         
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
+        # One UPDATE (capped at stock in SQL) or DELETE; None if not in the cart
+        new_quantity = get_cart(request).set_quantity(product, quantity)
+        if new_quantity is None:
+            raise Http404('No such item in your cart.')
+        if new_quantity > 0:
             messages.success(request, 'Cart updated successfully.')
         else:
-            cart_item.delete()
             messages.success(request, 'Item removed from cart.')
     
     return redirect('products:cart')
 
 
-@login_required
-def remove_from_cart(request, item_id):
+def update_cart_lines(request):
+    """
+    Apply all of the cart page's quantity changes in one request.
+
+    Expects a JSON body {"quantities": {"<product id>": <quantity>, ...}}
+    and answers with the updated lines and cart totals.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    try:
+        changes = json.loads(request.body)['quantities']
+        quantities = {int(product_id): int(quantity) for product_id, quantity in changes.items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+    
+    cart = get_cart(request)
+    updated = cart.update_quantities(quantities)
+    cart_items = cart.lines()
+    totals = cart.totals()
+    
+    return JsonResponse({
+        'lines': [
+            {
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                'total_price': f'{item.total_price:.2f}',
+            }
+            for item in cart_items
+        ],
+        # Requested quantities that were reduced to what is in stock
+        'capped': [
+            product_id for product_id, quantity in updated.items()
+            if 0 < quantity < quantities[product_id]
+        ],
+        'not_in_cart': [product_id for product_id in quantities if product_id not in updated],
+        'count': len(cart_items),
+        'subtotal': f'{totals.subtotal:.2f}',
+        'total': f'{totals.total:.2f}',
+    })
+
+
+def remove_from_cart(request, product_id):
     """Remove item from cart"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, id=item_id, user=request.user)
-        product_name = cart_item.product.name
-        cart_item.delete()
-        messages.success(request, f'Removed {product_name} from cart.')
+        # Not get_object_or_404: a line whose product was deleted must still go
+        name = Product.objects.filter(pk=product_id).values_list('name', flat=True).first()
+        if not get_cart(request).remove(product_id):
+            raise Http404('No such item in your cart.')
+        messages.success(request, f'Removed {name} from cart.' if name else 'Item removed from cart.')
     
     return redirect('products:cart')
 
@@ -197,6 +252,7 @@ def remove_from_cart(request, item_id):
 # Admin-only views for product management
 from django.contrib.admin.views.decorators import staff_member_required
 from .forms import ProductForm
+from .export import EXPORT_FORMATS, iter_catalog
 
 
 @staff_member_required
@@ -258,4 +314,20 @@ def product_delete(request, slug):
     context = {
         'product': product,
     }
-    return render(request, 'products/product_confirm_delete.html', context)
\ No newline at end of file
+    return render(request, 'products/product_confirm_delete.html', context)
+
+
+@staff_member_required
+def catalog_export(request):
+    """Stream the full catalog as CSV or JSONL (admin only)"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+    
+    content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        iter_catalog(export_format, base_url=request.build_absolute_uri('/').rstrip('/')),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+    return response